@@ -126,6 +126,23 @@ Content-Type: application/json
    }
 """
 
+"""
+4a. GET /user/{user_id}/bootstrap
+   Profile screen data in one call: the profile (as in GET /user/{user_id}),
+   the badge catalog with earned flags (as in GET /badges) and any badges
+   newly awarded by this call (as in POST /badges/check)
+
+   Headers:
+   Authorization: Bearer <firebase-id-token>
+
+   Response (200):
+   {
+     "profile": { ... },
+     "badges": [ ... ],
+     "newly_earned": [ ... ]
+   }
+"""
+
 # =============================================
 # QUIZ ENDPOINTS
 # =============================================
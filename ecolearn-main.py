@@ -5,73 +5,199 @@ Firebase Cloud Functions + Firestore Backend
 Main entry point for the Flask API wrapped as Firebase Functions
 """
 
+import functools
 import os
 import sys
+import threading
 from pathlib import Path
+from types import SimpleNamespace
 
 # Add the project root to the Python path
 project_root = Path(__file__).parent.absolute()
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, make_response
 from flask_cors import CORS
-from firebase_functions import https_fn, options
-from firebase_admin import initialize_app, get_app, credentials, firestore, auth
+from flask_compress import Compress
+from flask_limiter import ApplicationLimit, Limiter
+from flask_limiter.util import get_remote_address
+from firebase_functions import https_fn, options, scheduler_fn
+import firebase_admin
+from firebase_admin import initialize_app, get_app, credentials, firestore
 import logging
 
-# Import our services
-from services.auth_service import AuthService
-from flask import Flask, send_file
-
-from services.user_service import UserService
-from services.quiz_service import QuizService
-from services.badge_service import BadgeService
-from services.leaderboard_service import LeaderboardService
-from services.challenge_service import ChallengeService
-from utils.auth_middleware import require_auth, get_user_from_token
+from utils.concurrency import get_executor, run_parallel
+from utils.auth_middleware import authenticate_request, get_bearer_token, verify_id_token
 from utils.error_handler import handle_error
+from utils.json_provider import OrjsonProvider
 
-# Initialize Firebase Admin SDK
-try:
-    # Try to get the default app
-    app = get_app()
-except (ValueError, ImportError) as e:
-    # If the app doesn't exist, initialize it
-    try:
-        # For local development, use service account key
-        cred_path = os.path.join(os.path.dirname(__file__), 'serviceAccountKey.json')
-        if os.path.exists(cred_path):
-            cred = credentials.Certificate(cred_path)
-            app = initialize_app(cred)
-        else:
-            # Use default credentials in production
-            app = initialize_app()
-    except Exception as e:
-        print(f"Error initializing Firebase: {e}")
-        raise
-
-# Initialize Firestore client
-db = firestore.client()
+# Initialize Firebase Admin SDK (reuse the default app if it already exists)
+if firebase_admin._apps:
+    firebase_app = get_app()
+else:
+    # Use the service account key for local development, default credentials in production
+    cred_path = os.path.join(os.path.dirname(__file__), 'serviceAccountKey.json')
+    firebase_app = initialize_app(credentials.Certificate(cred_path) if os.path.exists(cred_path) else None)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.url_map.strict_slashes = False  # '/user/abc/' matches without a 308 redirect
+app.json = OrjsonProvider(app)
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 300
+
+# Compress JSON payloads (quizzes, leaderboards) for clients that accept it
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html']
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_LEVEL'] = 6
+app.config['COMPRESS_MIN_SIZE'] = 500
+Compress(app)
 
 
 CORS(app)
 
-# Initialize services
-auth_service = AuthService(db)
-user_service = UserService(db)
-quiz_service = QuizService(db)
-badge_service = BadgeService(db)
-leaderboard_service = LeaderboardService(db)
-challenge_service = ChallengeService(db)
+_services = None
+_services_lock = threading.Lock()
+
+def get_services():
+    """
+    Create the Firestore client and services once per worker process,
+    so warm Cloud Function invocations reuse the same gRPC channel.
+    The lock keeps a request racing the warm-up from building a second set
+    """
+    global _services
+    if _services is None:
+        with _services_lock:
+            if _services is None:
+                _services = _build_services()
+    return _services
+
+def _build_services():
+    """
+    Build the Firestore client and service graph. Service modules are
+    imported here to keep them off the cold-start path
+    """
+    from services.auth_service import AuthService
+    from services.user_service import UserService
+    from services.quiz_service import QuizService
+    from services.badge_service import BadgeService
+    from services.leaderboard_service import LeaderboardService
+    from services.challenge_service import ChallengeService
+    
+    # Optional shared cache for leaderboards across instances
+    redis_client = None
+    if os.environ.get('REDIS_URL'):
+        import redis
+        redis_client = redis.Redis.from_url(os.environ['REDIS_URL'])
+    
+    db = firestore.client()
+    leaderboard_service = LeaderboardService(db, redis_client=redis_client)
+    return SimpleNamespace(
+        db=db,
+        auth_service=AuthService(db),
+        user_service=UserService(db, leaderboard_service=leaderboard_service),
+        quiz_service=QuizService(db),
+        badge_service=BadgeService(db),
+        leaderboard_service=leaderboard_service,
+        challenge_service=ChallengeService(
+            db, watch_catalog=os.environ.get('WATCH_CHALLENGE_CATALOG', 'false').lower() == 'true'
+        )
+    )
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def warm_up():
+    """
+    Build the services and open the Firestore gRPC channel in the background,
+    overlapping the first request's token verification after a cold start
+    """
+    try:
+        get_services().db.collection('_warmup').document('_').get(timeout=2)
+    except Exception as e:
+        logger.debug("Warm-up read failed: %s", e)
+
+_warm_up_started = threading.Event()
+
+@app.before_request
+def start_warm_up():
+    """
+    Start the warm-up on the first request rather than at import, so deploy
+    discovery and test collection don't build the services
+    """
+    if not _warm_up_started.is_set():
+        _warm_up_started.set()
+        get_executor().submit(warm_up)
+
+
+# Route prefixes that require a verified Firebase ID token
+PROTECTED_PREFIXES = ('/user', '/quiz', '/challenge', '/badges', '/leaderboard', '/teacher')
+
+# Per-IP limits; generous by default because a whole classroom can share one NAT address
+AUTH_RATE_LIMIT = os.environ.get('AUTH_RATE_LIMIT', '30/minute')
+AUTH_FAILURE_LIMIT = f"{os.environ.get('MAX_AUTH_FAILURES_PER_MINUTE', 30)}/minute"
+
+@app.before_request
+def authenticate():
+    """
+    Verify the bearer token once per request for protected routes. A failure is
+    kept on g and returned by reject_unauthenticated, after the rate limiter has
+    counted it against the client's auth-failure limit
+    """
+    if request.method != 'OPTIONS' and request.path.startswith(PROTECTED_PREFIXES):
+        g.auth_error_response = authenticate_request()
+
+def rate_limit_key():
+    """Rate-limit authenticated callers per uid and anonymous ones per IP"""
+    current_user = g.get('current_user')
+    return current_user['uid'] if current_user else get_remote_address()
+
+def is_authenticated_or_unprotected():
+    """Only unauthenticated requests to protected routes count as auth failures"""
+    return g.get('current_user') is not None or not request.path.startswith(PROTECTED_PREFIXES)
+
+def auth_failure_breach_response(request_limit):
+    """JSON 429 for clients past the auth-failure limit"""
+    return make_response(jsonify({'error': 'Too many failed authentication attempts'}), 429)
+
+# Registered after the auth hook so g.current_user is set when limits are checked
+app.config['RATELIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+limiter = Limiter(
+    rate_limit_key,
+    app=app,
+    default_limits=[f"{os.environ.get('MAX_REQUESTS_PER_MINUTE', 60)}/minute"],
+    application_limits=[
+        ApplicationLimit(
+            AUTH_FAILURE_LIMIT,
+            key_function=get_remote_address,
+            scope='auth-failures',
+            exempt_when=is_authenticated_or_unprotected,
+            deduct_when=lambda response: response.status_code == 401,
+            on_breach=auth_failure_breach_response
+        )
+    ],
+    storage_uri=os.environ.get('RATE_LIMIT_STORAGE_URI', 'memory://')
+)
+
+@app.before_request
+def reject_unauthenticated():
+    """Return the auth failure recorded by authenticate once limits have been checked"""
+    return g.get('auth_error_response')
+
+def cacheable_json(payload, max_age=300, must_revalidate=True):
+    """
+    JSON response with an ETag and private Cache-Control; returns
+    304 Not Modified when the client's If-None-Match is still current
+    """
+    response = jsonify(payload)
+    response.add_etag()
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    if must_revalidate:
+        response.cache_control.must_revalidate = True
+    return response.make_conditional(request)
+
 
 # Local testing routes with /api prefix
 @app.route("/api/")
@@ -83,10 +209,19 @@ def api_test():
     return {"message": "Test route working!"}
 
 
+@functools.lru_cache(maxsize=1)
+def get_index_html():
+    """Read index.html once per process"""
+    return (project_root / 'index.html').read_bytes()
+
 # Root route for browser testing
 @app.route("/")
 def home():
-    return send_file("index.html")
+    response = Response(get_index_html(), mimetype='text/html')
+    response.add_etag()
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['SEND_FILE_MAX_AGE_DEFAULT']
+    return response.make_conditional(request)
 
 # Example test route
 @app.route("/test")
@@ -96,6 +231,7 @@ def test():
 
 # Health check endpoint
 @app.route('/health', methods=['GET'])
+@limiter.exempt
 def health_check():
     """Health check endpoint"""
     return jsonify({
@@ -107,6 +243,7 @@ def health_check():
 # ============= AUTH ENDPOINTS =============
 
 @app.route('/auth/signup', methods=['POST'])
+@limiter.limit(AUTH_RATE_LIMIT, key_func=get_remote_address)
 def signup():
     """Register a new user"""
     try:
@@ -116,7 +253,7 @@ def signup():
         # Normalize email casing to prevent duplicate vs not-found issues
         email = data.get('email', '').strip().lower()
 
-        result = auth_service.create_user(
+        result = get_services().auth_service.create_user(
             email=email,
             password=data['password'],
             name=data.get('name', 'EcoWarrior'),
@@ -128,6 +265,7 @@ def signup():
         return handle_error(e)
 
 @app.route('/auth/login', methods=['POST'])
+@limiter.limit(AUTH_RATE_LIMIT, key_func=get_remote_address)
 def login():
     """Login user and return custom token"""
     try:
@@ -137,7 +275,7 @@ def login():
         # Normalize email casing
         email = data.get('email', '').strip().lower()
 
-        result = auth_service.login_user(email, data['password'])
+        result = get_services().auth_service.login_user(email, data['password'])
         return jsonify(result)
     except Exception as e:
         return handle_error(e)
@@ -146,11 +284,11 @@ def login():
 def verify_token():
     """Verify Firebase ID token"""
     try:
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        token = get_bearer_token()
         if not token:
             return jsonify({'error': 'No token provided'}), 401
             
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = verify_id_token(token)
         return jsonify({
             'valid': True,
             'uid': decoded_token['uid'],
@@ -162,31 +300,57 @@ def verify_token():
 # ============= USER ENDPOINTS =============
 
 @app.route('/user/<user_id>', methods=['GET'])
-@require_auth
 def get_user_profile(user_id):
     """Get user profile with stats"""
     try:
         # Verify user can access this profile
-        current_user = get_user_from_token(request.headers.get('Authorization', '').replace('Bearer ', ''))
+        current_user = g.current_user
         if current_user['uid'] != user_id:
             return jsonify({'error': 'Unauthorized'}), 403
             
-        profile = user_service.get_user_profile(user_id)
-        return jsonify(profile)
+        profile = get_services().user_service.get_user_profile(user_id)
+        return cacheable_json(profile, max_age=30, must_revalidate=False)
+    except Exception as e:
+        return handle_error(e)
+
+@app.route('/user/<user_id>/bootstrap', methods=['GET'])
+def get_user_bootstrap(user_id):
+    """Get profile, badges and newly earned badges in one round-trip"""
+    try:
+        current_user = g.current_user
+        if current_user['uid'] != user_id:
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        services = get_services()
+        
+        def load_badges():
+            # Award first so the badge list already reflects new badges
+            newly_earned = services.badge_service.check_and_award_badges(user_id)
+            return newly_earned, services.badge_service.get_user_badges(user_id)
+        
+        profile, (newly_earned, badges) = run_parallel(
+            lambda: services.user_service.get_user_profile(user_id),
+            load_badges
+        )
+        
+        return jsonify({
+            'profile': profile,
+            'badges': badges,
+            'newly_earned': newly_earned
+        })
     except Exception as e:
         return handle_error(e)
 
 @app.route('/user/<user_id>', methods=['PUT'])
-@require_auth
 def update_user_profile(user_id):
     """Update user profile"""
     try:
-        current_user = get_user_from_token(request.headers.get('Authorization', '').replace('Bearer ', ''))
+        current_user = g.current_user
         if current_user['uid'] != user_id:
             return jsonify({'error': 'Unauthorized'}), 403
             
         data = request.get_json()
-        result = user_service.update_user_profile(user_id, data)
+        result = get_services().user_service.update_user_profile(user_id, data)
         return jsonify(result)
     except Exception as e:
         return handle_error(e)
@@ -194,90 +358,91 @@ def update_user_profile(user_id):
 # ============= QUIZ ENDPOINTS =============
 
 @app.route('/quizzes', methods=['GET'])
-@require_auth
 def get_quizzes():
     """Get all available quizzes"""
     try:
-        quizzes = quiz_service.get_all_quizzes()
-        return jsonify({'quizzes': quizzes})
+        quizzes = get_services().quiz_service.get_all_quizzes()
+        return cacheable_json({'quizzes': quizzes})
     except Exception as e:
         return handle_error(e)
 
 @app.route('/quiz/<quiz_id>', methods=['GET'])
-@require_auth
 def get_quiz(quiz_id):
     """Get specific quiz by ID"""
     try:
-        quiz = quiz_service.get_quiz_by_id(quiz_id)
-        return jsonify(quiz)
+        quiz = get_services().quiz_service.get_quiz_by_id(quiz_id)
+        return cacheable_json(quiz)
     except Exception as e:
         return handle_error(e)
 
 @app.route('/quiz/<quiz_id>/submit', methods=['POST'])
-@require_auth
 def submit_quiz(quiz_id):
     """Submit quiz answers and get results"""
     try:
-        current_user = get_user_from_token(request.headers.get('Authorization', '').replace('Bearer ', ''))
+        current_user = g.current_user
         data = request.get_json()
         
         if not data or 'answers' not in data:
             return jsonify({'error': 'Answers required'}), 400
             
-        result = quiz_service.submit_quiz(
+        services = get_services()
+        
+        # Record attempt, quiz stats and user stats in one transaction
+        result = services.quiz_service.submit_quiz_and_update_stats(
             user_id=current_user['uid'],
             quiz_id=quiz_id,
-            answers=data['answers']
+            answers=data['answers'],
+            user_service=services.user_service
         )
         
-        # Update user stats after quiz submission
-        user_service.update_user_stats_after_quiz(current_user['uid'], result)
-        
         return jsonify(result)
     except Exception as e:
         return handle_error(e)
 
 @app.route('/quiz/<quiz_id>/attempts', methods=['GET'])
-@require_auth
 def get_quiz_attempts(quiz_id):
     """Get user's quiz attempts"""
     try:
-        current_user = get_user_from_token(request.headers.get('Authorization', '').replace('Bearer ', ''))
-        attempts = quiz_service.get_user_quiz_attempts(current_user['uid'], quiz_id)
-        return jsonify({'attempts': attempts})
+        current_user = g.current_user
+        page = get_services().quiz_service.get_user_quiz_attempts(
+            current_user['uid'],
+            quiz_id,
+            limit=int(request.args.get('limit', 50)),
+            start_after=request.args.get('cursor')
+        )
+        return jsonify(page)
     except Exception as e:
         return handle_error(e)
 
 # ============= CHALLENGE ENDPOINTS =============
 
 @app.route('/challenges', methods=['GET'])
-@require_auth
 def get_challenges():
     """Get all available challenges"""
     try:
-        current_user = get_user_from_token(request.headers.get('Authorization', '').replace('Bearer ', ''))
-        challenges = challenge_service.get_user_challenges(current_user['uid'])
+        current_user = g.current_user
+        challenges = get_services().challenge_service.get_user_challenges(current_user['uid'])
         return jsonify({'challenges': challenges})
     except Exception as e:
         return handle_error(e)
 
 @app.route('/challenge/<challenge_id>/complete', methods=['POST'])
-@require_auth
 def complete_challenge(challenge_id):
     """Mark challenge as completed"""
     try:
-        current_user = get_user_from_token(request.headers.get('Authorization', '').replace('Bearer ', ''))
+        current_user = g.current_user
         data = request.get_json()
         
-        result = challenge_service.complete_challenge(
+        services = get_services()
+        
+        # Record completion, challenge stats and user stats in one transaction
+        result = services.challenge_service.complete_challenge_and_update_stats(
             user_id=current_user['uid'],
             challenge_id=challenge_id,
-            proof=data.get('proof', '')
+            proof=data.get('proof', ''),
+            user_service=services.user_service
         )
         
-        # Update user stats after challenge completion
-        user_service.update_user_stats_after_challenge(current_user['uid'], result)
-        
         return jsonify(result)
     except Exception as e:
         return handle_error(e)
@@ -285,23 +450,21 @@ def complete_challenge(challenge_id):
 # ============= BADGE ENDPOINTS =============
 
 @app.route('/badges', methods=['GET'])
-@require_auth
 def get_badges():
     """Get all available badges"""
     try:
-        current_user = get_user_from_token(request.headers.get('Authorization', '').replace('Bearer ', ''))
-        badges = badge_service.get_user_badges(current_user['uid'])
-        return jsonify({'badges': badges})
+        current_user = g.current_user
+        badges = get_services().badge_service.get_user_badges(current_user['uid'])
+        return cacheable_json({'badges': badges})
     except Exception as e:
         return handle_error(e)
 
 @app.route('/badges/check', methods=['POST'])
-@require_auth
 def check_badge_eligibility():
     """Check and award eligible badges for user"""
     try:
-        current_user = get_user_from_token(request.headers.get('Authorization', '').replace('Bearer ', ''))
-        newly_earned = badge_service.check_and_award_badges(current_user['uid'])
+        current_user = g.current_user
+        newly_earned = get_services().badge_service.check_and_award_badges(current_user['uid'])
         return jsonify({
             'newly_earned': newly_earned,
             'count': len(newly_earned)
@@ -312,17 +475,16 @@ def check_badge_eligibility():
 # ============= LEADERBOARD ENDPOINTS =============
 
 @app.route('/leaderboard', methods=['GET'])
-@require_auth
 def get_leaderboard():
     """Get leaderboard data"""
     try:
         scope = request.args.get('scope', 'global')  # global, school, class
-        period = request.args.get('period', 'all')   # weekly, monthly, all
+        period = request.args.get('period', 'all')   # daily, weekly, monthly, all
         limit = int(request.args.get('limit', 50))
         
-        current_user = get_user_from_token(request.headers.get('Authorization', '').replace('Bearer ', ''))
+        current_user = g.current_user
         
-        leaderboard = leaderboard_service.get_leaderboard(
+        leaderboard = get_services().leaderboard_service.get_leaderboard(
             scope=scope,
             period=period,
             limit=limit,
@@ -336,18 +498,17 @@ def get_leaderboard():
 # ============= TEACHER ENDPOINTS =============
 
 @app.route('/teacher/quiz', methods=['POST'])
-@require_auth
 def create_quiz():
     """Teacher creates a new quiz"""
     try:
-        current_user = get_user_from_token(request.headers.get('Authorization', '').replace('Bearer ', ''))
+        current_user = g.current_user
         # TODO: Add teacher role verification
         
         data = request.get_json()
         if not data or not data.get('title') or not data.get('questions'):
             return jsonify({'error': 'Title and questions required'}), 400
             
-        quiz = quiz_service.create_quiz(
+        quiz = get_services().quiz_service.create_quiz(
             created_by=current_user['uid'],
             title=data['title'],
             description=data.get('description', ''),
@@ -361,14 +522,13 @@ def create_quiz():
         return handle_error(e)
 
 @app.route('/teacher/class-progress/<class_id>', methods=['GET'])
-@require_auth
 def get_class_progress(class_id):
     """Teacher gets class progress overview"""
     try:
-        current_user = get_user_from_token(request.headers.get('Authorization', '').replace('Bearer ', ''))
+        current_user = g.current_user
         # TODO: Add teacher role verification and class ownership check
         
-        progress = user_service.get_class_progress(class_id)
+        progress = get_services().user_service.get_class_progress(class_id)
         return jsonify(progress)
     except Exception as e:
         return handle_error(e)
@@ -384,13 +544,13 @@ def seed_database():
             return jsonify({'error': 'Not allowed in production'}), 403
             
         # Seed quizzes
-        quiz_service.seed_quizzes()
+        get_services().quiz_service.seed_quizzes()
         
         # Seed challenges
-        challenge_service.seed_challenges()
+        get_services().challenge_service.seed_challenges()
         
         # Seed badges
-        badge_service.seed_badges()
+        get_services().badge_service.seed_badges()
         
         return jsonify({
             'message': 'Database seeded successfully',
@@ -410,7 +570,7 @@ def method_not_allowed(error):
 
 @app.errorhandler(500)
 def internal_error(error):
-    logger.error(f"Internal server error: {str(error)}")
+    logger.error("Internal server error: %s", error)
     return jsonify({'error': 'Internal server error'}), 500
 
 # Firebase Cloud Function wrapper
@@ -425,6 +585,15 @@ def api(req):
     with app.request_context(req.environ):
         return app.full_dispatch_request()
 
+@scheduler_fn.on_schedule(schedule="every 15 minutes")
+def rebuild_leaderboards(event):
+    """Scheduled Cloud Function that refreshes the materialized leaderboards"""
+    from services.leaderboard_service import LEADERBOARD_PERIODS
+    
+    leaderboard_service = get_services().leaderboard_service
+    for period in LEADERBOARD_PERIODS:
+        leaderboard_service.rebuild('global', period)
+
 # For local development
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8080)
\ No newline at end of file
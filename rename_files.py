@@ -1,12 +1,14 @@
 import os
-import shutil
 
 def rename_files(directory):
     # Change to the target directory
     os.chdir(directory)
     
-    # List all files in the directory
-    for filename in os.listdir('.'):
+    # Scan the directory; DirEntry caches the file type, so no extra stat per entry
+    with os.scandir('.') as entries:
+        filenames = [entry.name for entry in entries if entry.is_file()]
+    
+    for filename in filenames:
         if '-' in filename and filename.endswith('.py'):
             # Create new filename with underscores
             new_name = filename.replace('-', '_')
@@ -19,9 +21,9 @@ def rename_files(directory):
             
             # Rename the file
             try:
-                shutil.move(filename, new_name)
+                os.rename(filename, new_name)
                 print(f"Successfully renamed {filename} to {new_name}")
-            except Exception as e:
+            except OSError as e:
                 print(f"Error renaming {filename}: {e}")
 
 if __name__ == "__main__":
@@ -2,7 +2,7 @@
 # Firebase and Google Cloud dependencies
 firebase-admin>=6.2.0
 firebase-functions>=0.1.0
-google-cloud-firestore>=2.11.1
+google-cloud-firestore>=2.15.0
 google-cloud-storage>=2.10.0
 
 # Web framework
@@ -146,6 +146,20 @@ service cloud.firestore {
         }
       ]
     },
+    {
+      "collectionGroup": "quizzes",
+      "queryScope": "COLLECTION",
+      "fields": [
+        {
+          "fieldPath": "status",
+          "order": "ASCENDING"
+        },
+        {
+          "fieldPath": "created_at",
+          "order": "DESCENDING"
+        }
+      ]
+    },
     {
       "collectionGroup": "attempts",
       "queryScope": "COLLECTION",
@@ -187,6 +201,118 @@ service cloud.firestore {
           "order": "DESCENDING"
         }
       ]
+    },
+    {
+      "collectionGroup": "users",
+      "queryScope": "COLLECTION",
+      "fields": [
+        {
+          "fieldPath": "daily_period",
+          "order": "ASCENDING"
+        },
+        {
+          "fieldPath": "daily_xp",
+          "order": "DESCENDING"
+        }
+      ]
+    },
+    {
+      "collectionGroup": "users",
+      "queryScope": "COLLECTION",
+      "fields": [
+        {
+          "fieldPath": "weekly_period",
+          "order": "ASCENDING"
+        },
+        {
+          "fieldPath": "weekly_xp",
+          "order": "DESCENDING"
+        }
+      ]
+    },
+    {
+      "collectionGroup": "users",
+      "queryScope": "COLLECTION",
+      "fields": [
+        {
+          "fieldPath": "monthly_period",
+          "order": "ASCENDING"
+        },
+        {
+          "fieldPath": "monthly_xp",
+          "order": "DESCENDING"
+        }
+      ]
+    },
+    {
+      "collectionGroup": "users",
+      "queryScope": "COLLECTION",
+      "fields": [
+        {
+          "fieldPath": "daily_period",
+          "order": "ASCENDING"
+        },
+        {
+          "fieldPath": "daily_xp",
+          "order": "ASCENDING"
+        }
+      ]
+    },
+    {
+      "collectionGroup": "users",
+      "queryScope": "COLLECTION",
+      "fields": [
+        {
+          "fieldPath": "weekly_period",
+          "order": "ASCENDING"
+        },
+        {
+          "fieldPath": "weekly_xp",
+          "order": "ASCENDING"
+        }
+      ]
+    },
+    {
+      "collectionGroup": "users",
+      "queryScope": "COLLECTION",
+      "fields": [
+        {
+          "fieldPath": "monthly_period",
+          "order": "ASCENDING"
+        },
+        {
+          "fieldPath": "monthly_xp",
+          "order": "ASCENDING"
+        }
+      ]
+    },
+    {
+      "collectionGroup": "challenges",
+      "queryScope": "COLLECTION",
+      "fields": [
+        {
+          "fieldPath": "status",
+          "order": "ASCENDING"
+        },
+        {
+          "fieldPath": "created_at",
+          "order": "ASCENDING"
+        }
+      ]
+    },
+    {
+      "collectionGroup": "badges",
+      "queryScope": "COLLECTION",
+      "fields": [
+        {
+          "fieldPath": "active",
+          "order": "ASCENDING"
+        },
+        {
+          "fieldPath": "created_at",
+          "order": "ASCENDING"
+        }
+      ]
     }
   ],
   "fieldOverrides": []
@@ -212,6 +338,19 @@ ALLOWED_ORIGINS=http://localhost:3000,https://yourdomain.com
 # Rate Limiting
 RATE_LIMIT_ENABLED=true
 MAX_REQUESTS_PER_MINUTE=60
+# Per-IP limits; keep them generous since a classroom often shares one NAT address
+# Signup and login attempts per IP (any limits string, e.g. 30/minute or 200/hour)
+AUTH_RATE_LIMIT=30/minute
+# Failed token verifications per IP before protected routes answer 429
+MAX_AUTH_FAILURES_PER_MINUTE=30
+# Use a shared store (e.g. redis://host:6379) when running several instances
+RATE_LIMIT_STORAGE_URI=memory://
+
+# Caching
+# Shared leaderboard cache for multi-instance deployments (per-process cache when unset)
+REDIS_URL=
+# Keep the challenge catalog live via a snapshot listener (long-running servers, not Cloud Functions)
+WATCH_CHALLENGE_CATALOG=false
 
 # Logging
 LOG_LEVEL=INFO
@@ -3,21 +3,44 @@ Authentication Service for EcoLearn Platform
 Handles user registration, login, and Firebase Auth integration
 """
 
-import os
-import sys
-from pathlib import Path
-
-# Add the project root to the Python path
-project_root = Path(__file__).parent.parent.absolute()
-if str(project_root) not in sys.path:
-    sys.path.insert(0, str(project_root))
-
 from firebase_admin import auth, firestore
-from datetime import datetime
 import logging
 
+from utils.auth_middleware import verify_id_token
+from utils.cache import user_cache
+from utils.concurrency import run_parallel
+
 logger = logging.getLogger(__name__)
 
+# Starting values for every new user profile (badges is added per profile,
+# a shared list would leak between users)
+NEW_USER_DEFAULTS = {
+    'xp': 0,
+    'level': 1,
+    'points': 0,
+    'streak': 0,
+    'total_quizzes_completed': 0,
+    'total_challenges_completed': 0,
+    'current_streak_days': 0,
+    'last_active_date': None,
+}
+
+
+def build_new_user_profile(uid, name, email, avatar_url=''):
+    """
+    Build the Firestore profile for a new user; timestamps are set by the server
+    """
+    return {
+        **NEW_USER_DEFAULTS,
+        'id': uid,
+        'name': name,
+        'email': email,
+        'avatar_url': avatar_url,
+        'badges': [],
+        'created_at': firestore.SERVER_TIMESTAMP,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    }
+
 class AuthService:
     def __init__(self, db):
         self.db = db
@@ -36,29 +59,13 @@ class AuthService:
             )
             
             # Create user profile in Firestore
-            user_data = {
-                'id': user_record.uid,
-                'name': name,
-                'email': email,
-                'avatar_url': avatar_url,
-                'xp': 0,
-                'level': 1,
-                'points': 0,
-                'badges': [],
-                'streak': 0,
-                'total_quizzes_completed': 0,
-                'total_challenges_completed': 0,
-                'current_streak_days': 0,
-                'last_active_date': None,
-                'created_at': datetime.utcnow(),
-                'updated_at': datetime.utcnow()
-            }
-            
-            # Save to Firestore
-            self.users_ref.document(user_record.uid).set(user_data)
+            user_data = build_new_user_profile(user_record.uid, name, email, avatar_url)
             
-            # Generate custom token for immediate login
-            custom_token = auth.create_custom_token(user_record.uid)
+            # Save to Firestore while the custom token for immediate login is signed
+            _, custom_token = run_parallel(
+                lambda: self.users_ref.document(user_record.uid).set(user_data),
+                lambda: auth.create_custom_token(user_record.uid)
+            )
             
             logger.info(f"Created new user: {email} with ID: {user_record.uid}")
             
@@ -87,40 +94,35 @@ class AuthService:
             # Get user by email from Firebase Auth
             user_record = auth.get_user_by_email(email)
             
-            # Generate custom token
-            custom_token = auth.create_custom_token(user_record.uid)
+            # Last login stamp, written together with the profile in a single write
+            login_data = {
+                'last_login_at': firestore.SERVER_TIMESTAMP,
+                'updated_at': firestore.SERVER_TIMESTAMP
+            }
             
-            # Get user profile from Firestore (auto-create if missing)
+            # Generate custom token and get user profile from Firestore concurrently
             user_doc_ref = self.users_ref.document(user_record.uid)
-            user_doc = user_doc_ref.get()
+            custom_token, user_doc = run_parallel(
+                lambda: auth.create_custom_token(user_record.uid),
+                user_doc_ref.get
+            )
+            
+            # Auto-create the profile if missing
             if not user_doc.exists:
                 # Auto-heal: create a minimal profile if missing
                 user_data = {
-                    'id': user_record.uid,
-                    'name': getattr(user_record, 'display_name', None) or 'EcoWarrior',
-                    'email': email,
-                    'avatar_url': '',
-                    'xp': 0,
-                    'level': 1,
-                    'points': 0,
-                    'badges': [],
-                    'streak': 0,
-                    'total_quizzes_completed': 0,
-                    'total_challenges_completed': 0,
-                    'current_streak_days': 0,
-                    'last_active_date': None,
-                    'created_at': datetime.utcnow(),
-                    'updated_at': datetime.utcnow()
+                    **build_new_user_profile(
+                        user_record.uid,
+                        getattr(user_record, 'display_name', None) or 'EcoWarrior',
+                        email
+                    ),
+                    **login_data
                 }
-                self.users_ref.document(user_record.uid).set(user_data)
+                user_doc_ref.set(user_data)
             else:
                 user_data = user_doc.to_dict()
-            
-            # Update last login time
-            self.users_ref.document(user_record.uid).update({
-                'last_login_at': datetime.utcnow(),
-                'updated_at': datetime.utcnow()
-            })
+                user_doc_ref.update(login_data)
+            user_cache.pop(user_record.uid)
             
             logger.info(f"User logged in: {email}")
             
@@ -146,18 +148,28 @@ class AuthService:
             logger.error(f"Error logging in user: {str(e)}")
             raise ValueError(f"Failed to login: {str(e)}")
     
-    def verify_user_token(self, id_token):
+    def verify_user_token(self, id_token, check_revoked=False):
         """
-        Verify Firebase ID token and return decoded user info
+        Verify Firebase ID token and return user info taken from its claims;
+        the Auth backend is only called when check_revoked is set
         """
         try:
-            decoded_token = auth.verify_id_token(id_token)
+            if check_revoked:
+                decoded_token = auth.verify_id_token(id_token, check_revoked=True)
+            else:
+                decoded_token = verify_id_token(id_token)
+            
             return {
                 'success': True,
                 'uid': decoded_token['uid'],
                 'email': decoded_token.get('email', ''),
-                'email_verified': decoded_token.get('email_verified', False)
+                'email_verified': decoded_token.get('email_verified', False),
+                'name': decoded_token.get('name', ''),
+                'picture': decoded_token.get('picture', '')
             }
+        except auth.RevokedIdTokenError:
+            logger.warning("Revoked ID token provided")
+            raise ValueError("Token revoked")
         except auth.InvalidIdTokenError:
             logger.warning("Invalid ID token provided")
             raise ValueError("Invalid token")
@@ -173,11 +185,17 @@ class AuthService:
         Get user data by Firebase UID
         """
         try:
-            user_doc = self.users_ref.document(uid).get()
-            if not user_doc.exists:
-                return None
+            user_data = user_cache.get(uid)
+            if user_data is None:
+                user_doc = self.users_ref.document(uid).get()
+                if not user_doc.exists:
+                    return None
+                
+                user_data = user_doc.to_dict()
+                user_cache.set(uid, user_data)
             
-            return user_doc.to_dict()
+            # Callers get their own copy so the cached document stays intact
+            return dict(user_data)
         except Exception as e:
             logger.error(f"Error getting user by UID: {str(e)}")
             return None
@@ -204,6 +222,7 @@ class AuthService:
             
             # Delete from Firestore
             self.users_ref.document(uid).delete()
+            user_cache.pop(uid)
             
             logger.info(f"Deleted user: {uid}")
             return True
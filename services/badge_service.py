@@ -3,12 +3,27 @@ Badge Service for EcoLearn Platform
 Handles badge management, criteria checking, and awarding system
 """
 
+from firebase_admin import firestore
 from datetime import datetime, timedelta
 import logging
 import uuid
 
+from utils.batch import commit_in_batches
+from utils.cache import TTLCache, user_cache
+from utils.concurrency import SingleFlight
+
 logger = logging.getLogger(__name__)
 
+# criteria type -> (user field, criteria field, user default, criteria default)
+# for badges earned by reaching a number on the user document
+THRESHOLD_CRITERIA = {
+    'xp_threshold': ('xp', 'xp_required', 0, 0),
+    'level_threshold': ('level', 'level_required', 1, 1),
+    'quiz_completion': ('total_quizzes_completed', 'quizzes_required', 0, 1),
+    'challenge_completion': ('total_challenges_completed', 'challenges_required', 0, 1),
+    'streak': ('current_streak_days', 'streak_days_required', 0, 1),
+}
+
 class BadgeService:
     def __init__(self, db):
         self.db = db
@@ -16,20 +31,41 @@ class BadgeService:
         self.users_ref = db.collection('users')
         self.attempts_ref = db.collection('attempts')
         self.user_badges_ref = db.collection('user_badges')
+        # Badge catalog; read on every badge listing and award check
+        self._catalog_cache = TTLCache(maxsize=256, ttl=300)
+        # Concurrent award checks for the same user share one run
+        self._award_checks = SingleFlight()
+        # Criteria types that need more than a threshold: type -> handler(user_id, criteria, user_data)
+        self._criteria_handlers = {
+            'perfect_score': self._check_perfect_score,
+            'category_mastery': self._check_category_criteria,
+            'social': self._check_social_criteria,
+            'time_based': self._check_time_based_criteria,
+        }
     
     def get_all_badges(self):
         """
         Get all available badges in the system
         """
         try:
+            cached = self._catalog_cache.get('all')
+            if cached is not None:
+                return cached
+            
             badges = []
-            for badge_doc in self.badges_ref.stream():
+            # Retired badges stay in Firestore but are neither listed nor awarded;
+            # Firestore returns the rest in creation order
+            active_badges = self.badges_ref.where('active', '==', True).order_by('created_at')
+            for badge_doc in active_badges.stream():
                 badge_data = badge_doc.to_dict()
                 badge_data['id'] = badge_doc.id
                 badges.append(badge_data)
             
-            # Sort by creation order
-            badges.sort(key=lambda x: x.get('created_at', datetime.min))
+            self._catalog_cache.set('all', badges)
+            # Compiled alongside the catalog so both expire and invalidate together
+            self._catalog_cache.set('checks', {
+                badge['id']: self._compile_criterion(badge.get('criteria', {})) for badge in badges
+            })
             return badges
             
         except Exception as e:
@@ -41,46 +77,77 @@ class BadgeService:
         Get user's earned badges along with available badges
         """
         try:
-            # Get user's earned badges
-            user_badges_query = self.user_badges_ref.where('user_id', '==', user_id).stream()
-            earned_badge_ids = set()
+            # Earned badges are denormalized onto the user document; fetch only those fields
+            user_doc = self.users_ref.document(user_id).get(field_paths=['badges', 'badge_earned_at'])
+            user_data = user_doc.to_dict() if user_doc.exists else {}
+            earned_badge_ids = set(user_data.get('badges', []))
+            earned_at_map = user_data.get('badge_earned_at', {})
+            if not earned_badge_ids.issubset(earned_at_map):
+                earned_at_map = self._backfill_badge_earned_at(user_id, earned_badge_ids, earned_at_map)
+            
+            all_badges = []
             earned_badges = []
+            available_badges = []
             
-            for user_badge_doc in user_badges_query:
-                user_badge_data = user_badge_doc.to_dict()
-                earned_badge_ids.add(user_badge_data['badge_id'])
-                earned_badges.append(user_badge_data)
-            
-            # Get all available badges
-            all_badges = self.get_all_badges()
-            
-            # Mark which badges are earned
-            for badge in all_badges:
+            # One pass: copy each cached badge, overlay this user's status and split
+            for cached_badge in self.get_all_badges():
+                badge = dict(cached_badge)
                 badge['earned'] = badge['id'] in earned_badge_ids
-                badge['earned_at'] = None
+                badge['earned_at'] = earned_at_map.get(badge['id'])
                 
-                # Add earned date if available
-                for earned_badge in earned_badges:
-                    if earned_badge['badge_id'] == badge['id']:
-                        badge['earned_at'] = earned_badge.get('earned_at')
-                        break
+                all_badges.append(badge)
+                (earned_badges if badge['earned'] else available_badges).append(badge)
             
             return {
                 'all_badges': all_badges,
-                'earned_badges': [b for b in all_badges if b['earned']],
-                'available_badges': [b for b in all_badges if not b['earned']],
+                'earned_badges': earned_badges,
+                'available_badges': available_badges,
                 'total_badges': len(all_badges),
-                'earned_count': len([b for b in all_badges if b['earned']])
+                'earned_count': len(earned_badges)
             }
             
         except Exception as e:
             logger.error(f"Error getting user badges: {str(e)}")
             raise ValueError(f"Failed to get user badges: {str(e)}")
     
+    def _backfill_badge_earned_at(self, user_id, earned_badge_ids, earned_at_map):
+        """
+        Recover earned_at for badges awarded before badge_earned_at existed from
+        the user_badges audit log, and write it back to the user document so
+        the lookup is only needed once per user
+        """
+        missing_ids = earned_badge_ids - set(earned_at_map)
+        earned_at_map = dict(earned_at_map)
+        backfill = {}
+        
+        # Older award records have generated ids, so look them up by user
+        user_badges_query = self.user_badges_ref.where('user_id', '==', user_id).select(['badge_id', 'earned_at'])
+        for user_badge_doc in user_badges_query.stream():
+            user_badge_data = user_badge_doc.to_dict()
+            badge_id = user_badge_data.get('badge_id')
+            if badge_id in missing_ids and user_badge_data.get('earned_at') is not None:
+                earned_at_map[badge_id] = user_badge_data['earned_at']
+                backfill[f'badge_earned_at.{badge_id}'] = user_badge_data['earned_at']
+        
+        if backfill:
+            try:
+                self.users_ref.document(user_id).update(backfill)
+                user_cache.pop(user_id)
+            except Exception as e:
+                logger.warning(f"Could not backfill badge_earned_at for user {user_id}: {str(e)}")
+        
+        return earned_at_map
+    
     def check_and_award_badges(self, user_id):
         """
         Check user's eligibility for badges and award new ones
         """
+        return self._award_checks.do(user_id, lambda: self._check_and_award_badges(user_id))
+    
+    def _check_and_award_badges(self, user_id):
+        """
+        Evaluate and award badges for one user (coalesced by check_and_award_badges)
+        """
         try:
             # Get user data
             user_doc = self.users_ref.document(user_id).get()
@@ -89,20 +156,22 @@ class BadgeService:
             
             user_data = user_doc.to_dict()
             
-            # Get user's current badges
-            current_badges = self._get_user_earned_badge_ids(user_id)
+            # Get user's current badges from the document already read
+            current_badges = set(user_data.get('badges', []))
             
-            # Get all badge definitions
-            all_badges = self.get_all_badges()
+            # Only badges not yet earned need their criteria evaluated
+            remaining_badges = [badge for badge in self.get_all_badges() if badge['id'] not in current_badges]
             
-            newly_earned = []
+            checks = self._get_criteria_checks()
+            newly_earned = [
+                badge for badge in remaining_badges
+                if self._check_badge_criteria(user_id, badge, user_data, checks.get(badge['id']))
+            ]
             
-            for badge in all_badges:
-                if badge['id'] not in current_badges:
-                    # Check if user meets criteria
-                    if self._check_badge_criteria(user_id, badge, user_data):
-                        self._award_badge_to_user(user_id, badge['id'])
-                        newly_earned.append(badge)
+            # Award the whole burst in one commit
+            if newly_earned:
+                awarded_ids = set(self._award_badges_to_user(user_id, [badge['id'] for badge in newly_earned]))
+                newly_earned = [badge for badge in newly_earned if badge['id'] in awarded_ids]
             
             logger.info(f"Checked badges for user {user_id}, awarded {len(newly_earned)} new badges")
             return newly_earned
@@ -111,59 +180,70 @@ class BadgeService:
             logger.error(f"Error checking badge eligibility: {str(e)}")
             raise ValueError(f"Failed to check badge eligibility: {str(e)}")
     
-    def _check_badge_criteria(self, user_id, badge, user_data):
+    def _get_criteria_checks(self):
+        """
+        Get the compiled criteria check for each catalog badge, keyed by badge id
+        """
+        checks = self._catalog_cache.get('checks')
+        if checks is None:
+            self._catalog_cache.pop('all')
+            self.get_all_badges()
+            checks = self._catalog_cache.get('checks') or {}
+        return checks
+    
+    def _compile_criterion(self, criteria):
+        """
+        Turn a badge's criteria into a check(user_id, user_data) callable, with
+        the required values resolved once instead of on every award check
+        """
+        badge_type = criteria.get('type')
+        
+        threshold = THRESHOLD_CRITERIA.get(badge_type)
+        if threshold is not None:
+            user_field, required_field, user_default, required_default = threshold
+            required = criteria.get(required_field, required_default)
+            return lambda user_id, user_data: user_data.get(user_field, user_default) >= required
+        
+        handler = self._criteria_handlers.get(badge_type)
+        if handler is None:
+            return lambda user_id, user_data: False
+        return lambda user_id, user_data: handler(user_id, criteria, user_data)
+    
+    def _check_badge_criteria(self, user_id, badge, user_data, check=None):
         """
         Check if user meets specific badge criteria
         """
         try:
-            criteria = badge.get('criteria', {})
-            badge_type = criteria.get('type')
-            
-            if badge_type == 'xp_threshold':
-                return user_data.get('xp', 0) >= criteria.get('xp_required', 0)
-            
-            elif badge_type == 'level_threshold':
-                return user_data.get('level', 1) >= criteria.get('level_required', 1)
-            
-            elif badge_type == 'quiz_completion':
-                return user_data.get('total_quizzes_completed', 0) >= criteria.get('quizzes_required', 1)
-            
-            elif badge_type == 'perfect_score':
-                # Check if user has any perfect quiz scores
-                return self._has_perfect_quiz_score(user_id)
-            
-            elif badge_type == 'challenge_completion':
-                return user_data.get('total_challenges_completed', 0) >= criteria.get('challenges_required', 1)
-            
-            elif badge_type == 'streak':
-                return user_data.get('current_streak_days', 0) >= criteria.get('streak_days_required', 1)
-            
-            elif badge_type == 'category_mastery':
-                category = criteria.get('category')
-                required_score = criteria.get('average_score_required', 80)
-                return self._check_category_mastery(user_id, category, required_score)
-            
-            elif badge_type == 'social':
-                # Check social achievements like sharing, teaching others
-                return self._check_social_criteria(user_id, criteria)
-            
-            elif badge_type == 'time_based':
-                # Check time-based achievements
-                return self._check_time_based_criteria(user_id, criteria, user_data)
-            
-            return False
+            if check is None:
+                check = self._compile_criterion(badge.get('criteria', {}))
+            return check(user_id, user_data)
             
         except Exception as e:
             logger.error(f"Error checking badge criteria: {str(e)}")
             return False
     
+    def _check_perfect_score(self, user_id, criteria, user_data):
+        """
+        Check the perfect_score criterion (any quiz scored 100%)
+        """
+        return self._has_perfect_quiz_score(user_id)
+    
+    def _check_category_criteria(self, user_id, criteria, user_data):
+        """
+        Check the category_mastery criterion
+        """
+        category = criteria.get('category')
+        required_score = criteria.get('average_score_required', 80)
+        return self._check_category_mastery(user_id, category, required_score)
+    
     def _has_perfect_quiz_score(self, user_id):
         """
         Check if user has achieved a perfect score on any quiz
         """
         try:
-            perfect_attempts = self.attempts_ref.where('user_id', '==', user_id).where('score_percentage', '==', 100.0).limit(1).stream()
-            return len(list(perfect_attempts)) > 0
+            # Existence only: a capped count() transfers no document payload
+            perfect_count = self.attempts_ref.where('user_id', '==', user_id).where('score_percentage', '==', 100.0).limit(1).count().get()
+            return perfect_count[0][0].value > 0
         except:
             return False
     
@@ -178,7 +258,7 @@ class BadgeService:
         except:
             return False
     
-    def _check_social_criteria(self, user_id, criteria):
+    def _check_social_criteria(self, user_id, criteria, user_data=None):
         """
         Check social-based badge criteria
         """
@@ -201,52 +281,43 @@ class BadgeService:
         except:
             return False
     
-    def _get_user_earned_badge_ids(self, user_id):
+    def _award_badges_to_user(self, user_id, badge_ids):
         """
-        Get list of badge IDs that user has already earned
+        Award one or more badges to a user in a single blind batch write; returns
+        the ids awarded. Every write is idempotent, so a concurrent award of the
+        same badge cannot duplicate it
         """
         try:
-            earned_badges = set()
-            for badge_doc in self.user_badges_ref.where('user_id', '==', user_id).stream():
-                badge_data = badge_doc.to_dict()
-                earned_badges.add(badge_data['badge_id'])
-            return earned_badges
-        except:
-            return set()
-    
-    def _award_badge_to_user(self, user_id, badge_id):
-        """
-        Award a badge to a user
-        """
-        try:
-            # Create user badge record
-            user_badge_data = {
-                'user_id': user_id,
-                'badge_id': badge_id,
-                'earned_at': datetime.utcnow(),
-                'created_at': datetime.utcnow()
+            batch = self.db.batch()
+            
+            # user_badges is an append-only audit log; reads use the user doc.
+            # One record id per (user, badge) so a repeated award rewrites it
+            for badge_id in badge_ids:
+                batch.set(self.user_badges_ref.document(f'{user_id}_{badge_id}'), {
+                    'user_id': user_id,
+                    'badge_id': badge_id,
+                    'earned_at': firestore.SERVER_TIMESTAMP,
+                    'created_at': firestore.SERVER_TIMESTAMP
+                })
+            
+            # ArrayUnion appends server-side without reading the current list
+            user_update = {
+                'badges': firestore.ArrayUnion(badge_ids),
+                'updated_at': firestore.SERVER_TIMESTAMP
             }
+            for badge_id in badge_ids:
+                user_update[f'badge_earned_at.{badge_id}'] = firestore.SERVER_TIMESTAMP
+            batch.update(self.users_ref.document(user_id), user_update)
             
-            self.user_badges_ref.add(user_badge_data)
+            batch.commit()
+            user_cache.pop(user_id)
             
-            # Update user's badge list
-            user_doc = self.users_ref.document(user_id).get()
-            if user_doc.exists:
-                user_data = user_doc.to_dict()
-                current_badges = user_data.get('badges', [])
-                if badge_id not in current_badges:
-                    current_badges.append(badge_id)
-                    self.users_ref.document(user_id).update({
-                        'badges': current_badges,
-                        'updated_at': datetime.utcnow()
-                    })
-            
-            logger.info(f"Awarded badge {badge_id} to user {user_id}")
-            return True
+            logger.info(f"Awarded badges {badge_ids} to user {user_id}")
+            return badge_ids
             
         except Exception as e:
-            logger.error(f"Error awarding badge: {str(e)}")
-            return False
+            logger.error(f"Error awarding badges: {str(e)}")
+            return []
     
     def create_badge(self, name, description, icon_url, criteria, category='general'):
         """
@@ -261,13 +332,14 @@ class BadgeService:
                 'category': category,
                 'rarity': criteria.get('rarity', 'common'),
                 'points_value': criteria.get('points_value', 10),
-                'created_at': datetime.utcnow(),
-                'updated_at': datetime.utcnow(),
+                'created_at': firestore.SERVER_TIMESTAMP,
+                'updated_at': firestore.SERVER_TIMESTAMP,
                 'active': True
             }
             
             badge_ref = self.badges_ref.add(badge_data)
             badge_id = badge_ref[1].id
+            self._catalog_cache.clear()
             
             logger.info(f"Created new badge: {name}")
             
@@ -396,13 +468,20 @@ class BadgeService:
                 }
             ]
             
-            for badge_data in sample_badges:
-                badge_data['created_at'] = datetime.utcnow()
-                badge_data['updated_at'] = datetime.utcnow()
+            now = datetime.utcnow()
+            writes = []
+            for i, badge_data in enumerate(sample_badges):
+                # Offset by position so get_all_badges keeps the seed order
+                badge_data['created_at'] = now + timedelta(microseconds=i)
+                badge_data['updated_at'] = firestore.SERVER_TIMESTAMP
                 badge_data['active'] = True
                 
-                self.badges_ref.add(badge_data)
+                writes.append((self.badges_ref.document(), badge_data))
+            
+            # One batch: a failed seed leaves no partial catalog behind
+            commit_in_batches(self.db, writes)
             
+            self._catalog_cache.clear()
             logger.info("Seeded badge database with sample data")
             return True
             
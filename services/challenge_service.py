@@ -3,32 +3,140 @@ Challenge Service for EcoLearn Platform
 Handles eco-challenges, completion tracking, and reward distribution
 """
 
+from firebase_admin import firestore
+from collections import defaultdict
 from datetime import datetime, timedelta
+from operator import itemgetter
+import heapq
 import uuid
 import logging
 
+from services.leaderboard_service import get_period_start
+from utils.batch import commit_in_batches
+from utils.cache import TTLCache, user_cache
+from utils.concurrency import run_parallel
+
 logger = logging.getLogger(__name__)
 
+# XP/points multiplier per challenge difficulty
+DIFFICULTY_MULTIPLIERS = {
+    'easy': 1.0,
+    'medium': 1.2,
+    'hard': 1.5,
+    'expert': 2.0
+}
+
+COMPLETION_MESSAGES = {
+    'waste': "Great job reducing waste! Every action counts towards a cleaner planet.",
+    'energy': "Excellent energy conservation! You're helping reduce carbon emissions.",
+    'water': "Amazing water conservation effort! You're protecting this precious resource.",
+    'transportation': "Fantastic eco-friendly transportation choice! You've reduced your carbon footprint.",
+    'food': "Wonderful sustainable food choice! You're supporting eco-friendly practices.",
+    'education': "Great job spreading environmental awareness! Knowledge is power for change."
+}
+DEFAULT_COMPLETION_MESSAGE = "Congratulations on completing this eco-challenge!"
+HARD_CHALLENGE_SUFFIX = " This was a challenging task - you should be proud!"
+
+# Completion fields read by get_user_challenge_stats; proof text and ids stay on the server
+CHALLENGE_STATS_FIELDS = ['xp_reward', 'points_reward', 'challenge_category', 'challenge_title', 'completed_at']
+
+# Same-category challenges considered for suggestions; Firestore 'in' accepts up to 30 values
+SUGGESTION_CANDIDATES = 10
+
+# Minimum wait between attempts to resubscribe a stopped catalog listener
+CATALOG_WATCH_RETRY_SECONDS = 30
+
+class CategoryStats:
+    """
+    Running completion count and XP for one challenge category
+    """
+    __slots__ = ('count', 'xp')
+    
+    def __init__(self):
+        self.count = 0
+        self.xp = 0
+
 class ChallengeService:
-    def __init__(self, db):
+    def __init__(self, db, watch_catalog=False):
         self.db = db
         self.challenges_ref = db.collection('challenges')
         self.user_challenges_ref = db.collection('user_challenges')
         self.users_ref = db.collection('users')
+        # Active challenge catalog; shared by all users, so cached globally
+        self._catalog_cache = TTLCache(maxsize=256, ttl=300)
+        # Live copy of the catalog kept current by a snapshot listener (long-running servers only)
+        self._catalog_snapshot = None
+        self._catalog_watch = None
+        self._catalog_watch_retry_at = None
+        if watch_catalog:
+            self._watch_catalog()
+    
+    def _watch_catalog(self):
+        """
+        Keep the active catalog in memory through a Firestore snapshot listener,
+        so catalog reads never hit Firestore and never go stale for a TTL
+        """
+        self._catalog_watch_retry_at = datetime.utcnow() + timedelta(seconds=CATALOG_WATCH_RETRY_SECONDS)
+        try:
+            active_challenges = self.challenges_ref.where('status', '==', 'active').order_by('created_at')
+            self._catalog_watch = active_challenges.on_snapshot(self._on_catalog_snapshot)
+        except Exception as e:
+            logger.error(f"Error subscribing to challenge catalog: {str(e)}")
+            self._catalog_watch = None
+    
+    def _on_catalog_snapshot(self, docs, changes, read_time):
+        """
+        Replace the in-memory catalog with the listener's latest query result
+        """
+        try:
+            self._catalog_snapshot = [{**doc.to_dict(), 'id': doc.id} for doc in docs]
+        except Exception as e:
+            logger.error(f"Error applying challenge catalog snapshot: {str(e)}")
+            self._catalog_snapshot = None
+    
+    def _check_catalog_watch(self):
+        """
+        Drop the live catalog once its listener has stopped streaming, so reads
+        fall back to the TTL cache, and resubscribe after the retry interval
+        """
+        if self._catalog_watch_retry_at is None:
+            return
+        if self._catalog_watch is not None and self._catalog_watch.is_active:
+            return
+        
+        self._catalog_snapshot = None
+        if datetime.utcnow() < self._catalog_watch_retry_at:
+            return
+        
+        logger.warning("Challenge catalog listener stopped; resubscribing")
+        if self._catalog_watch is not None:
+            try:
+                self._catalog_watch.unsubscribe()
+            except Exception:
+                pass
+        self._watch_catalog()
     
     def get_all_challenges(self):
         """
         Get all available challenges
         """
         try:
-            challenges = []
-            for challenge_doc in self.challenges_ref.where('status', '==', 'active').stream():
-                challenge_data = challenge_doc.to_dict()
-                challenge_data['id'] = challenge_doc.id
-                challenges.append(challenge_data)
+            self._check_catalog_watch()
+            if self._catalog_snapshot is not None:
+                return self._catalog_snapshot
+            
+            cached = self._catalog_cache.get('all')
+            if cached is not None:
+                return cached
+            
+            # Firestore returns active challenges already in creation order
+            active_challenges = self.challenges_ref.where('status', '==', 'active').order_by('created_at')
+            challenges = [
+                {**challenge_doc.to_dict(), 'id': challenge_doc.id}
+                for challenge_doc in active_challenges.stream()
+            ]
             
-            # Sort by creation date
-            challenges.sort(key=lambda x: x.get('created_at', datetime.min))
+            self._catalog_cache.set('all', challenges)
             return challenges
             
         except Exception as e:
@@ -40,34 +148,34 @@ class ChallengeService:
         Get challenges with user's completion status
         """
         try:
-            # Get all challenges
-            all_challenges = self.get_all_challenges()
-            
-            # Get user's completed challenges
-            completed_challenges = set()
-            user_challenge_docs = self.user_challenges_ref.where('user_id', '==', user_id).stream()
+            # Copy cached challenges before overlaying this user's status
+            all_challenges = [dict(challenge) for challenge in self.get_all_challenges()]
             
+            # One query for all of the user's completions, bucketed per challenge;
+            # recurring progress is computed from these buckets with no further reads
             user_completions = {}
-            for doc in user_challenge_docs:
+            for doc in self.user_challenges_ref.where('user_id', '==', user_id).stream():
                 completion_data = doc.to_dict()
-                challenge_id = completion_data['challenge_id']
-                completed_challenges.add(challenge_id)
-                user_completions[challenge_id] = completion_data
+                user_completions.setdefault(completion_data['challenge_id'], []).append(completion_data)
+            
+            available_count = 0
             
             # Enhance challenges with user status
             for challenge in all_challenges:
-                challenge_id = challenge['id']
-                challenge['completed'] = challenge_id in completed_challenges
-                challenge['completion_data'] = user_completions.get(challenge_id)
+                completions = user_completions.get(challenge['id'])
+                challenge['completed'] = completions is not None
+                challenge['completion_data'] = completions[-1] if completions else None
+                if not completions:
+                    available_count += 1
                 
                 # Calculate progress if applicable
                 if challenge.get('type') == 'recurring':
-                    challenge['progress'] = self._calculate_recurring_progress(user_id, challenge)
+                    challenge['progress'] = self._calculate_recurring_progress(challenge, completions or [])
             
             return {
                 'challenges': all_challenges,
-                'completed_count': len(completed_challenges),
-                'available_count': len([c for c in all_challenges if not c['completed']]),
+                'completed_count': len(user_completions),
+                'available_count': available_count,
                 'total_count': len(all_challenges)
             }
             
@@ -75,81 +183,121 @@ class ChallengeService:
             logger.error(f"Error getting user challenges: {str(e)}")
             raise ValueError(f"Failed to get user challenges: {str(e)}")
     
-    def complete_challenge(self, user_id, challenge_id, proof=""):
+    def complete_challenge_and_update_stats(self, user_id, challenge_id, proof, user_service):
         """
-        Mark a challenge as completed for a user
+        Complete a challenge and apply the completion record, challenge
+        statistics and user stats in a single Firestore transaction
         """
         try:
-            # Get challenge details
-            challenge_doc = self.challenges_ref.document(challenge_id).get()
-            if not challenge_doc.exists:
-                raise ValueError("Challenge not found")
-            
-            challenge_data = challenge_doc.to_dict()
-            
-            # Check if already completed
-            existing_completion = self.user_challenges_ref.where('user_id', '==', user_id).where('challenge_id', '==', challenge_id).limit(1).stream()
-            
-            if len(list(existing_completion)) > 0:
-                # For recurring challenges, allow multiple completions
-                if challenge_data.get('type') != 'recurring':
-                    raise ValueError("Challenge already completed")
-            
-            # Calculate rewards
-            base_xp = challenge_data.get('xp_reward', 0)
-            base_points = challenge_data.get('points_reward', 0)
-            
-            # Apply multipliers for difficulty
-            difficulty_multiplier = self._get_difficulty_multiplier(challenge_data.get('difficulty', 'medium'))
-            
-            final_xp = int(base_xp * difficulty_multiplier)
-            final_points = int(base_points * difficulty_multiplier)
-            
-            # Create completion record
-            completion_data = {
-                'user_id': user_id,
-                'challenge_id': challenge_id,
-                'challenge_title': challenge_data.get('title', ''),
-                'challenge_category': challenge_data.get('category', 'general'),
-                'xp_reward': final_xp,
-                'points_reward': final_points,
-                'proof_submitted': proof,
-                'status': 'completed',
-                'completed_at': datetime.utcnow(),
-                'created_at': datetime.utcnow()
-            }
-            
-            # Save completion record
-            self.user_challenges_ref.add(completion_data)
+            challenge_ref = self.challenges_ref.document(challenge_id)
+            user_ref = self.users_ref.document(user_id)
+            existing_query = self._existing_completion_query(user_id, challenge_id)
+            
+            @firestore.transactional
+            def _complete(transaction):
+                challenge_doc = challenge_ref.get(transaction=transaction)
+                if not challenge_doc.exists:
+                    raise ValueError("Challenge not found")
+                
+                user_doc = user_ref.get(transaction=transaction)
+                if not user_doc.exists:
+                    raise ValueError("User not found")
+                
+                challenge_data = challenge_doc.to_dict()
+                already_completed = next(existing_query.stream(transaction=transaction), None) is not None
+                
+                completion_data, result = self._build_completion(
+                    user_id, challenge_id, challenge_data, proof, already_completed
+                )
+                user_update, user_stats = user_service.build_challenge_stats_update(
+                    user_id, user_doc.to_dict(), result
+                )
+                
+                transaction.set(self.user_challenges_ref.document(uuid.uuid4().hex), completion_data)
+                transaction.update(challenge_ref, {
+                    'total_completions': firestore.Increment(1),
+                    'updated_at': datetime.utcnow()
+                })
+                transaction.update(user_ref, user_update)
+                
+                return challenge_data, result, user_stats
             
-            # Update challenge statistics
-            self._update_challenge_stats(challenge_id)
+            challenge_data, result, user_stats = _complete(self.db.transaction())
+            user_cache.pop(user_id)
             
-            # Check for challenge-based achievements
-            self._check_challenge_achievements(user_id)
+            # Follow-up work after the commit is independent, so overlap it. The live
+            # XP ranking (Redis) is not transactional, so it is pushed once the commit lands
+            _, _, suggestions = run_parallel(
+                lambda: user_service.update_user_leaderboard_position(user_id, user_stats['new_xp'], user_stats['new_level']),
+                lambda: self._check_challenge_achievements(user_id),
+                lambda: self._get_suggested_challenges(user_id, challenge_data.get('category'))
+            )
             
-            logger.info(f"Challenge completed - User: {user_id}, Challenge: {challenge_id}, XP: {final_xp}")
+            logger.info(f"Challenge completed - User: {user_id}, Challenge: {challenge_id}, XP: {result['xp_reward']}")
             
-            return {
-                'challenge_id': challenge_id,
-                'challenge_title': challenge_data.get('title'),
-                'xp_reward': final_xp,
-                'points_reward': final_points,
-                'difficulty_multiplier': difficulty_multiplier,
-                'completion_message': self._get_completion_message(challenge_data),
-                'next_suggested_challenges': self._get_suggested_challenges(user_id, challenge_data.get('category'))
-            }
+            result['next_suggested_challenges'] = suggestions
+            return result
             
         except Exception as e:
             logger.error(f"Error completing challenge: {str(e)}")
             raise ValueError(f"Failed to complete challenge: {str(e)}")
     
+    def _existing_completion_query(self, user_id, challenge_id):
+        """
+        Query for an existing completion of a challenge by a user
+        """
+        return self.user_challenges_ref.where('user_id', '==', user_id).where('challenge_id', '==', challenge_id).limit(1)
+    
+    def _build_completion(self, user_id, challenge_id, challenge_data, proof, already_completed):
+        """
+        Calculate rewards and build the completion record and response
+        """
+        # For recurring challenges, allow multiple completions
+        if already_completed and challenge_data.get('type') != 'recurring':
+            raise ValueError("Challenge already completed")
+        
+        # Calculate rewards
+        base_xp = challenge_data.get('xp_reward', 0)
+        base_points = challenge_data.get('points_reward', 0)
+        
+        # Apply multipliers for difficulty
+        difficulty_multiplier = self._get_difficulty_multiplier(challenge_data.get('difficulty', 'medium'))
+        
+        final_xp = int(base_xp * difficulty_multiplier)
+        final_points = int(base_points * difficulty_multiplier)
+        
+        # Create completion record
+        now = datetime.utcnow()
+        completion_data = {
+            'user_id': user_id,
+            'challenge_id': challenge_id,
+            'challenge_title': challenge_data.get('title', ''),
+            'challenge_category': challenge_data.get('category', 'general'),
+            'xp_reward': final_xp,
+            'points_reward': final_points,
+            'proof_submitted': proof,
+            'status': 'completed',
+            'completed_at': now,
+            'created_at': now
+        }
+        
+        return completion_data, {
+            'challenge_id': challenge_id,
+            'challenge_title': challenge_data.get('title'),
+            'xp_reward': final_xp,
+            'points_reward': final_points,
+            'difficulty_multiplier': difficulty_multiplier,
+            'completion_message': self._get_completion_message(challenge_data)
+        }
+    
     def get_user_challenge_stats(self, user_id):
         """
         Get user's challenge completion statistics
         """
         try:
-            completions = list(self.user_challenges_ref.where('user_id', '==', user_id).stream())
+            completions = list(
+                self.user_challenges_ref.where('user_id', '==', user_id).select(CHALLENGE_STATS_FIELDS).stream()
+            )
             
             if not completions:
                 return {
@@ -163,49 +311,51 @@ class ChallengeService:
             
             total_xp = 0
             total_points = 0
-            categories = {}
-            recent_completions = []
+            categories = defaultdict(CategoryStats)
+            dated_completions = []
             
             # Process completions
-            completion_dates = []
+            completion_days = []
             
             for doc in completions:
                 completion_data = doc.to_dict()
                 
-                total_xp += completion_data.get('xp_reward', 0)
+                xp = completion_data.get('xp_reward', 0)
+                total_xp += xp
                 total_points += completion_data.get('points_reward', 0)
                 
                 # Track by category
-                category = completion_data.get('challenge_category', 'general')
-                if category not in categories:
-                    categories[category] = {'count': 0, 'xp': 0}
-                categories[category]['count'] += 1
-                categories[category]['xp'] += completion_data.get('xp_reward', 0)
+                category_stats = categories[completion_data.get('challenge_category', 'general')]
+                category_stats.count += 1
+                category_stats.xp += xp
                 
-                # Recent completions (last 10)
-                if len(recent_completions) < 10:
-                    recent_completions.append({
-                        'challenge_title': completion_data.get('challenge_title'),
-                        'completed_at': completion_data.get('completed_at'),
-                        'xp_earned': completion_data.get('xp_reward', 0)
-                    })
-                
-                # Track completion dates for streak calculation
+                # Track completion dates for streak calculation and recency
                 completed_date = completion_data.get('completed_at')
                 if completed_date:
-                    completion_dates.append(completed_date.date())
+                    completion_days.append(completed_date.toordinal())
+                    dated_completions.append(completion_data)
             
             # Calculate streaks
-            streak_data = self._calculate_challenge_streak(completion_dates)
+            streak_data = self._calculate_challenge_streak(completion_days)
             
-            # Sort recent completions by date
-            recent_completions.sort(key=lambda x: x.get('completed_at', datetime.min), reverse=True)
+            # Ten most recent completions, newest first, without sorting the full history
+            recent_completions = [
+                {
+                    'challenge_title': completion_data.get('challenge_title'),
+                    'completed_at': completion_data['completed_at'],
+                    'xp_earned': completion_data.get('xp_reward', 0)
+                }
+                for completion_data in heapq.nlargest(10, dated_completions, key=itemgetter('completed_at'))
+            ]
             
             return {
                 'total_completed': len(completions),
                 'total_xp_earned': total_xp,
                 'total_points_earned': total_points,
-                'categories': categories,
+                'categories': {
+                    category: {'count': stats.count, 'xp': stats.xp}
+                    for category, stats in categories.items()
+                },
                 'recent_completions': recent_completions,
                 'streak_data': streak_data
             }
@@ -219,6 +369,7 @@ class ChallengeService:
         Create a new challenge (admin function)
         """
         try:
+            now = datetime.utcnow()
             challenge_data = {
                 'title': title,
                 'description': description,
@@ -229,12 +380,13 @@ class ChallengeService:
                 'points_reward': points_reward,
                 'status': 'active',
                 'total_completions': 0,
-                'created_at': datetime.utcnow(),
-                'updated_at': datetime.utcnow()
+                'created_at': now,
+                'updated_at': now
             }
             
-            challenge_ref = self.challenges_ref.add(challenge_data)
-            challenge_id = challenge_ref[1].id
+            challenge_id = uuid.uuid4().hex
+            self.challenges_ref.document(challenge_id).set(challenge_data)
+            self._catalog_cache.clear()
             
             logger.info(f"Created new challenge: {title}")
             
@@ -252,34 +404,16 @@ class ChallengeService:
         """
         Get XP/Points multiplier based on difficulty
         """
-        multipliers = {
-            'easy': 1.0,
-            'medium': 1.2,
-            'hard': 1.5,
-            'expert': 2.0
-        }
-        return multipliers.get(difficulty, 1.0)
+        return DIFFICULTY_MULTIPLIERS.get(difficulty, 1.0)
     
     def _get_completion_message(self, challenge_data):
         """
         Generate completion message based on challenge
         """
-        category = challenge_data.get('category', 'general')
-        difficulty = challenge_data.get('difficulty', 'medium')
-        
-        messages = {
-            'waste': "Great job reducing waste! Every action counts towards a cleaner planet.",
-            'energy': "Excellent energy conservation! You're helping reduce carbon emissions.",
-            'water': "Amazing water conservation effort! You're protecting this precious resource.",
-            'transportation': "Fantastic eco-friendly transportation choice! You've reduced your carbon footprint.",
-            'food': "Wonderful sustainable food choice! You're supporting eco-friendly practices.",
-            'education': "Great job spreading environmental awareness! Knowledge is power for change."
-        }
+        base_message = COMPLETION_MESSAGES.get(challenge_data.get('category', 'general'), DEFAULT_COMPLETION_MESSAGE)
         
-        base_message = messages.get(category, "Congratulations on completing this eco-challenge!")
-        
-        if difficulty == 'hard':
-            base_message += " This was a challenging task - you should be proud!"
+        if challenge_data.get('difficulty', 'medium') == 'hard':
+            base_message += HARD_CHALLENGE_SUFFIX
         
         return base_message
     
@@ -288,50 +422,45 @@ class ChallengeService:
         Get suggested next challenges based on completion
         """
         try:
-            # Get challenges from same category that user hasn't completed
-            user_completed = set()
-            for doc in self.user_challenges_ref.where('user_id', '==', user_id).stream():
-                user_completed.add(doc.to_dict().get('challenge_id'))
-            
-            suggestions = []
-            for doc in self.challenges_ref.where('category', '==', completed_category).where('status', '==', 'active').limit(3).stream():
-                if doc.id not in user_completed:
-                    challenge_data = doc.to_dict()
-                    suggestions.append({
-                        'id': doc.id,
-                        'title': challenge_data.get('title'),
-                        'difficulty': challenge_data.get('difficulty'),
-                        'xp_reward': challenge_data.get('xp_reward')
-                    })
+            # Candidates come from the cached catalog (already in creation order)
+            candidates = [
+                challenge for challenge in self.get_all_challenges()
+                if challenge.get('category') == completed_category
+            ][:SUGGESTION_CANDIDATES]
+            if not candidates:
+                return []
+            
+            # Look up the user's completions of just these candidates, not their full history
+            completed_query = (
+                self.user_challenges_ref
+                .where('user_id', '==', user_id)
+                .where('challenge_id', 'in', [challenge['id'] for challenge in candidates])
+                .select(['challenge_id'])
+            )
+            user_completed = {doc.get('challenge_id') for doc in completed_query.stream()}
+            
+            suggestions = [
+                {
+                    'id': challenge['id'],
+                    'title': challenge.get('title'),
+                    'difficulty': challenge.get('difficulty'),
+                    'xp_reward': challenge.get('xp_reward')
+                }
+                for challenge in candidates if challenge['id'] not in user_completed
+            ][:3]
             
             return suggestions
         except:
             return []
     
-    def _update_challenge_stats(self, challenge_id):
-        """
-        Update challenge completion statistics
-        """
-        try:
-            challenge_ref = self.challenges_ref.document(challenge_id)
-            challenge_doc = challenge_ref.get()
-            
-            if challenge_doc.exists:
-                current_completions = challenge_doc.to_dict().get('total_completions', 0)
-                challenge_ref.update({
-                    'total_completions': current_completions + 1,
-                    'updated_at': datetime.utcnow()
-                })
-        except Exception as e:
-            logger.error(f"Error updating challenge stats: {str(e)}")
-    
     def _check_challenge_achievements(self, user_id):
         """
         Check for challenge-based achievements/badges
         """
         try:
             # Count user's total challenge completions
-            total_completions = len(list(self.user_challenges_ref.where('user_id', '==', user_id).stream()))
+            count_result = self.user_challenges_ref.where('user_id', '==', user_id).count().get()
+            total_completions = count_result[0][0].value
             
             # This would integrate with badge service to check for milestone badges
             # For now, just log the achievement
@@ -341,51 +470,55 @@ class ChallengeService:
         except Exception as e:
             logger.error(f"Error checking challenge achievements: {str(e)}")
     
-    def _calculate_challenge_streak(self, completion_dates):
+    def _calculate_challenge_streak(self, completion_days):
         """
-        Calculate challenge completion streak
+        Calculate challenge completion streak from day ordinals (date.toordinal())
         """
-        if not completion_dates:
+        if not completion_days:
             return {'current_streak': 0, 'longest_streak': 0}
         
-        # Sort dates
-        sorted_dates = sorted(set(completion_dates), reverse=True)
+        # Sort days, most recent first
+        sorted_days = sorted(set(completion_days), reverse=True)
         
-        current_streak = 1
+        # One walk over the runs of consecutive days: the first run is the
+        # current streak, the longest run is the longest streak
+        current_streak = None
         longest_streak = 1
-        temp_streak = 1
+        run = 1
         
-        # Calculate current streak (from most recent date)
-        for i in range(1, len(sorted_dates)):
-            if (sorted_dates[i-1] - sorted_dates[i]).days == 1:
-                current_streak += 1
+        for previous, day in zip(sorted_days, sorted_days[1:]):
+            if previous - day == 1:
+                run += 1
+                longest_streak = max(longest_streak, run)
             else:
-                break
+                if current_streak is None:
+                    current_streak = run
+                run = 1
         
-        # Calculate longest streak
-        for i in range(1, len(sorted_dates)):
-            if (sorted_dates[i-1] - sorted_dates[i]).days == 1:
-                temp_streak += 1
-                longest_streak = max(longest_streak, temp_streak)
-            else:
-                temp_streak = 1
+        if current_streak is None:
+            current_streak = run
         
         return {
             'current_streak': current_streak,
             'longest_streak': longest_streak
         }
     
-    def _calculate_recurring_progress(self, user_id, challenge):
+    def _calculate_recurring_progress(self, challenge, completions):
         """
-        Calculate progress for recurring challenges
+        Calculate this week's progress for a recurring challenge from the
+        user's already-fetched completions of it
         """
         try:
-            # This is a placeholder for recurring challenge logic
-            # Would track weekly/monthly completions
+            week_start = get_period_start('weekly')
+            current_period = sum(
+                1 for completion in completions
+                if completion.get('completed_at') and completion['completed_at'].replace(tzinfo=None) >= week_start
+            )
+            target = challenge.get('target_completions', 1)
             return {
-                'current_period': 0,
-                'target': challenge.get('target_completions', 1),
-                'progress_percentage': 0
+                'current_period': current_period,
+                'target': target,
+                'progress_percentage': min(100, round(current_period / target * 100)) if target else 0
             }
         except:
             return {'current_period': 0, 'target': 1, 'progress_percentage': 0}
@@ -478,13 +611,20 @@ class ChallengeService:
                 }
             ]
             
-            for challenge_data in sample_challenges:
+            now = datetime.utcnow()
+            writes = []
+            for i, challenge_data in enumerate(sample_challenges):
                 challenge_data['total_completions'] = 0
-                challenge_data['created_at'] = datetime.utcnow()
-                challenge_data['updated_at'] = datetime.utcnow()
+                # Offset by position so get_all_challenges keeps the seed order
+                challenge_data['created_at'] = now + timedelta(microseconds=i)
+                challenge_data['updated_at'] = now
                 
-                self.challenges_ref.add(challenge_data)
+                writes.append((self.challenges_ref.document(uuid.uuid4().hex), challenge_data))
+            
+            # One batch: a failed seed leaves no partial catalog behind
+            commit_in_batches(self.db, writes)
             
+            self._catalog_cache.clear()
             logger.info("Seeded challenge database with sample data")
             return True
             
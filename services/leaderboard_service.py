@@ -6,14 +6,73 @@ Handles global and scoped leaderboards with real-time ranking
 from datetime import datetime, timedelta
 import logging
 
+import orjson
+
+from utils.cache import TTLCache
+from utils.concurrency import run_parallel
+
 logger = logging.getLogger(__name__)
 
+# Periods refreshed by the scheduled leaderboard rebuild
+LEADERBOARD_PERIODS = ('all', 'daily', 'weekly', 'monthly')
+
+# Materialized leaderboard limits (bounded by Firestore's 1 MiB document size)
+MATERIALIZED_ENTRY_LIMIT = 100
+MATERIALIZED_RANK_LIMIT = 5000
+MATERIALIZED_MAX_AGE = timedelta(minutes=30)
+
+# Seconds a computed leaderboard is served from cache
+LEADERBOARD_CACHE_TTL = 60
+
+# Redis sorted set of user_id -> all-time XP
+XP_RANKING_KEY = 'lb:global:xp'
+
+# Periods ranked from denormalized per-user counters (daily_xp, weekly_xp, monthly_xp)
+COUNTER_PERIODS = ('daily', 'weekly', 'monthly')
+
+# User fields shown on leaderboard entries; ranking reads project to these
+LEADERBOARD_PROFILE_FIELDS = ['name', 'xp', 'level', 'badges', 'avatar_url', 'current_streak_days']
+
+
+def get_period_start(period, now=None):
+    """
+    Start of the current calendar period in UTC (weeks start on Sunday)
+    """
+    now = now or datetime.utcnow()
+    today = datetime(now.year, now.month, now.day)
+    
+    if period == 'daily':
+        return today
+    elif period == 'weekly':
+        return today - timedelta(days=(today.weekday() + 1) % 7)
+    elif period == 'monthly':
+        return today.replace(day=1)
+    else:
+        return datetime.min  # All time
+
+def get_period_key(period, now=None):
+    """
+    Key identifying the current period, stored next to the per-user counters
+    """
+    return get_period_start(period, now).strftime('%Y-%m-%d')
+
+def get_counter_profile_fields(period):
+    """
+    User fields needed to rank and display a daily/weekly/monthly leaderboard entry
+    """
+    return ['name', 'level', 'badges', 'avatar_url'] + [
+        f'{period}_{counter}' for counter in ('period', 'xp', 'attempts', 'score_total')
+    ]
+
 class LeaderboardService:
-    def __init__(self, db):
+    def __init__(self, db, redis_client=None):
         self.db = db
         self.users_ref = db.collection('users')
         self.leaderboards_ref = db.collection('leaderboards')
-        self.attempts_ref = db.collection('attempts')
+        # Rankings change slowly; cache them in Redis (shared by all instances) when
+        # configured, otherwise per process
+        self.redis = redis_client
+        self._board_cache = TTLCache(maxsize=64, ttl=LEADERBOARD_CACHE_TTL)
     
     def get_leaderboard(self, scope='global', period='all', limit=50, current_user_id=None):
         """
@@ -38,36 +97,163 @@ class LeaderboardService:
         Get global leaderboard for all users
         """
         try:
-            # Calculate time filter if needed
-            time_filter = self._get_time_filter(period)
+            # One clock reading per request keeps freshness checks and period keys consistent
+            now = datetime.utcnow()
+            
+            # The ranking is shared by all users; only the current user's position differs.
+            # Keyed by period key so a cached board does not outlive its day/week/month
+            cache_key = f'lb:global:{period}:{get_period_key(period, now)}:{limit}'
+            cached = self._get_cached_board(cache_key)
+            if cached is not None:
+                return self._with_current_user(cached, period, current_user_id)
+            
+            # Serve from the materialized leaderboard when it is fresh
+            board = self._get_materialized_leaderboard('global', period, limit, current_user_id, now)
+            if board is None:
+                try:
+                    board = self._compute_global_leaderboard(period, limit, current_user_id, now)
+                except Exception:
+                    if period not in COUNTER_PERIODS:
+                        raise
+                    # Degrade to an empty (uncached) period board rather than failing the request
+                    return {
+                        'scope': 'global',
+                        'period': period,
+                        'entries': [],
+                        'current_user': None,
+                        'total_entries': 0,
+                        'updated_at': now
+                    }
+            
+            self._set_cached_board(cache_key, {**board, 'current_user': None})
+            return board
+            
+        except Exception as e:
+            logger.error(f"Error getting global leaderboard: {str(e)}")
+            raise
+    
+    def _get_cached_board(self, key):
+        """
+        Get a cached leaderboard (without current user data) from Redis when
+        configured, otherwise from the in-process cache
+        """
+        if self.redis is None:
+            return self._board_cache.get(key)
+        
+        try:
+            raw = self.redis.get(key)
+        except Exception as e:
+            logger.error(f"Error reading cached leaderboard: {str(e)}")
+            return None
+        
+        if raw is None:
+            return None
+        
+        board = orjson.loads(raw)
+        board['updated_at'] = datetime.fromisoformat(board['updated_at'])
+        return board
+    
+    def _set_cached_board(self, key, board):
+        """
+        Cache a leaderboard for LEADERBOARD_CACHE_TTL seconds
+        """
+        if self.redis is None:
+            self._board_cache.set(key, board)
+            return
+        
+        try:
+            payload = orjson.dumps({**board, 'updated_at': board['updated_at'].isoformat()})
+            self.redis.setex(key, LEADERBOARD_CACHE_TTL, payload)
+        except Exception as e:
+            logger.error(f"Error caching leaderboard: {str(e)}")
+    
+    def _with_current_user(self, board, period, current_user_id):
+        """
+        Overlay the current user's rank on a cached leaderboard
+        """
+        current_user_rank = None
+        current_user_data = None
+        
+        if current_user_id:
+            for entry in board['entries']:
+                if entry['user_id'] == current_user_id:
+                    current_user_rank = entry['rank']
+                    current_user_data = entry
+                    break
+            else:
+                current_user_rank, current_user_data = self._find_live_user_rank(current_user_id, period)
+        
+        return {
+            **board,
+            'current_user': {
+                'rank': current_user_rank,
+                'data': current_user_data
+            } if current_user_data else None
+        }
+    
+    def _find_live_user_rank(self, user_id, period, now=None):
+        """
+        Rank a user who is not on a stored or cached board against current data
+        """
+        if period == 'all':
+            return self._find_user_rank(user_id, 'xp')
+        return self._find_counter_user_rank(user_id, period, now)
+    
+    def _build_ranked_user_entry(self, user_id, rank, period):
+        """
+        Build a leaderboard entry for a user whose rank is already known,
+        from a projected read of their profile
+        """
+        field_paths = LEADERBOARD_PROFILE_FIELDS if period == 'all' else get_counter_profile_fields(period)
+        user_doc = self.users_ref.document(user_id).get(field_paths=field_paths)
+        if not user_doc.exists:
+            return None
+        
+        if period == 'all':
+            return self._build_user_entry(rank, user_id, user_doc.to_dict())
+        return self._build_counter_entry(rank, user_id, user_doc.to_dict(), period)
+    
+    def _compute_global_leaderboard(self, period, limit, current_user_id, now=None):
+        """
+        Compute global leaderboard directly from Firestore
+        """
+        try:
+            now = now or datetime.utcnow()
             
             if period == 'all':
-                # Use user XP for all-time leaderboard
-                users_query = self.users_ref.order_by('xp', direction='DESCENDING').limit(limit)
+                # Use user XP for all-time leaderboard, ranked by the Redis sorted set when available
+                ranked_ids = self._get_ranked_user_ids(limit)
+                outside_rank = None
+                if ranked_ids is not None:
+                    if current_user_id and current_user_id not in ranked_ids:
+                        # The ranking already shows the user is outside the top: look up their rank
+                        # alongside. _find_user_rank fans out itself, so it stays on this thread
+                        outside_rank, profiles = run_parallel(
+                            lambda: self._find_user_rank(current_user_id, 'xp'),
+                            lambda: self._fetch_users_batch(ranked_ids, LEADERBOARD_PROFILE_FIELDS)
+                        )
+                    else:
+                        profiles = self._fetch_users_batch(ranked_ids, LEADERBOARD_PROFILE_FIELDS)
+                    ranked_users = [(user_id, profiles[user_id]) for user_id in ranked_ids if user_id in profiles]
+                else:
+                    users_query = (
+                        self.users_ref.select(LEADERBOARD_PROFILE_FIELDS)
+                        .order_by('xp', direction='DESCENDING').limit(limit)
+                    )
+                    ranked_users = [(user_doc.id, user_doc.to_dict()) for user_doc in users_query.stream()]
+                
                 entries = []
                 
                 rank = 1
                 current_user_rank = None
                 current_user_data = None
                 
-                for user_doc in users_query.stream():
-                    user_data = user_doc.to_dict()
-                    
-                    entry = {
-                        'rank': rank,
-                        'user_id': user_doc.id,
-                        'name': user_data.get('name', 'EcoWarrior'),
-                        'xp': user_data.get('xp', 0),
-                        'level': user_data.get('level', 1),
-                        'badges': len(user_data.get('badges', [])),
-                        'avatar_url': user_data.get('avatar_url', ''),
-                        'streak': user_data.get('current_streak_days', 0)
-                    }
-                    
+                for user_id, user_data in ranked_users:
+                    entry = self._build_user_entry(rank, user_id, user_data)
                     entries.append(entry)
                     
                     # Track current user
-                    if user_doc.id == current_user_id:
+                    if user_id == current_user_id:
                         current_user_rank = rank
                         current_user_data = entry
                     
@@ -75,13 +261,18 @@ class LeaderboardService:
                 
                 # If current user not in top results, find their rank
                 if current_user_id and current_user_rank is None:
-                    current_user_rank, current_user_data = self._find_user_rank(current_user_id, 'xp')
+                    if outside_rank is None:
+                        outside_rank = self._find_user_rank(current_user_id, 'xp')
+                    current_user_rank, current_user_data = outside_rank
                 
-            else:
-                # Use period-based scoring (quiz attempts)
-                entries, current_user_rank, current_user_data = self._get_period_leaderboard(
-                    time_filter, limit, current_user_id
+            elif period in COUNTER_PERIODS:
+                # Let Firestore rank users by their period counters
+                entries, current_user_rank, current_user_data = self._get_counter_period_leaderboard(
+                    period, limit, current_user_id, now
                 )
+                
+            else:
+                raise ValueError("Invalid leaderboard period")
             
             return {
                 'scope': 'global',
@@ -92,98 +283,220 @@ class LeaderboardService:
                     'data': current_user_data
                 } if current_user_data else None,
                 'total_entries': len(entries),
-                'updated_at': datetime.utcnow()
+                'updated_at': now
             }
             
         except Exception as e:
-            logger.error(f"Error getting global leaderboard: {str(e)}")
+            logger.error(f"Error computing global leaderboard: {str(e)}")
             raise
     
-    def _get_period_leaderboard(self, time_filter, limit, current_user_id):
+    def _build_user_entry(self, rank, user_id, user_data):
         """
-        Get leaderboard for a specific time period based on quiz performance
+        Build an all-time leaderboard entry from a user document
+        """
+        return {
+            'rank': rank,
+            'user_id': user_id,
+            'name': user_data.get('name', 'EcoWarrior'),
+            'xp': user_data.get('xp', 0),
+            'level': user_data.get('level', 1),
+            'badges': len(user_data.get('badges', [])),
+            'avatar_url': user_data.get('avatar_url', ''),
+            'streak': user_data.get('current_streak_days', 0)
+        }
+    
+    def _get_counter_period_leaderboard(self, period, limit, current_user_id, now=None):
+        """
+        Get a daily/weekly/monthly leaderboard ordered server-side by the users'
+        denormalized period XP counters
         """
         try:
-            # Get all quiz attempts in the time period
-            attempts_query = self.attempts_ref.where('created_at', '>=', time_filter).stream()
+            period_key = get_period_key(period, now)
+            xp_field = f'{period}_xp'
+            period_users = self.users_ref.where(f'{period}_period', '==', period_key)
             
-            # Aggregate user scores
-            user_scores = {}
+            entries = []
+            current_user_rank = None
+            current_user_data = None
             
-            for attempt_doc in attempts_query:
-                attempt_data = attempt_doc.to_dict()
-                user_id = attempt_data.get('user_id')
-                earned_xp = attempt_data.get('earned_xp', 0)
-                
-                if user_id not in user_scores:
-                    user_scores[user_id] = {
-                        'xp': 0,
-                        'attempts': 0,
-                        'total_score': 0
-                    }
+            users_query = (
+                period_users.select(get_counter_profile_fields(period))
+                .order_by(xp_field, direction='DESCENDING').limit(limit)
+            )
+            for rank, user_doc in enumerate(users_query.stream(), 1):
+                entry = self._build_counter_entry(rank, user_doc.id, user_doc.to_dict(), period)
+                entries.append(entry)
                 
-                user_scores[user_id]['xp'] += earned_xp
-                user_scores[user_id]['attempts'] += 1
-                user_scores[user_id]['total_score'] += attempt_data.get('score', 0)
+                if user_doc.id == current_user_id:
+                    current_user_rank = rank
+                    current_user_data = entry
+            
+            if current_user_id and current_user_rank is None:
+                current_user_rank, current_user_data = self._find_counter_user_rank(current_user_id, period, now)
+            
+            return entries, current_user_rank, current_user_data
+            
+        except Exception as e:
+            logger.error(f"Error getting {period} leaderboard: {str(e)}")
+            raise
+    
+    def _find_counter_user_rank(self, user_id, period, now=None):
+        """
+        Rank a user on a period leaderboard with a count aggregation instead of a scan
+        """
+        user_doc = self.users_ref.document(user_id).get(field_paths=get_counter_profile_fields(period))
+        if not user_doc.exists:
+            return None, None
+        
+        user_data = user_doc.to_dict()
+        period_key = get_period_key(period, now)
+        if user_data.get(f'{period}_period') != period_key:
+            return None, None
+        
+        xp_field = f'{period}_xp'
+        higher_count = (
+            self.users_ref
+            .where(f'{period}_period', '==', period_key)
+            .where(xp_field, '>', user_data.get(xp_field, 0))
+            .count().get()
+        )
+        rank = higher_count[0][0].value + 1
+        return rank, self._build_counter_entry(rank, user_id, user_data, period)
+    
+    def _build_counter_entry(self, rank, user_id, user_data, period):
+        """
+        Build a period leaderboard entry from a user's period counters
+        """
+        attempts = user_data.get(f'{period}_attempts', 0)
+        
+        return {
+            'rank': rank,
+            'user_id': user_id,
+            'name': user_data.get('name', 'EcoWarrior'),
+            'xp': user_data.get(f'{period}_xp', 0),
+            'level': user_data.get('level', 1),
+            'badges': len(user_data.get('badges', [])),
+            'avatar_url': user_data.get('avatar_url', ''),
+            'period_attempts': attempts,
+            'average_score': user_data.get(f'{period}_score_total', 0) / attempts if attempts > 0 else 0
+        }
+    
+    def _fetch_users_batch(self, user_ids, field_paths=None):
+        """
+        Fetch user documents in a single batched read, optionally projected to
+        field_paths; returns {user_id: user_data} for the users that exist
+        """
+        if not user_ids:
+            return {}
+        
+        user_refs = [self.users_ref.document(user_id) for user_id in user_ids]
+        return {
+            user_doc.id: user_doc.to_dict()
+            for user_doc in self.db.get_all(user_refs, field_paths=field_paths)
+            if user_doc.exists
+        }
+    
+    def _get_materialized_leaderboard(self, scope, period, limit, current_user_id, now=None):
+        """
+        Read a precomputed leaderboard written by rebuild(); returns None if
+        it is missing, stale or too short for the requested limit
+        """
+        try:
+            board_doc = self.leaderboards_ref.document(f'{scope}_{period}').get()
+            if not board_doc.exists:
+                return None
+            
+            board_data = board_doc.to_dict()
+            built_at = board_data.get('updated_at')
+            now = now or datetime.utcnow()
+            if not built_at or now - built_at.replace(tzinfo=None) > MATERIALIZED_MAX_AGE:
+                return None
+            
+            # A board built in an earlier day/week/month is stale once the period rolls over
+            if board_data.get('period_key') != get_period_key(period, now):
+                return None
+            
+            stored_entries = board_data.get('entries', [])
+            if limit > len(stored_entries) and board_data.get('truncated'):
+                return None
+            
+            entries = stored_entries[:limit]
             
-            # Get user details and create entries
-            entries = []
             current_user_rank = None
             current_user_data = None
+            if current_user_id:
+                current_user_rank = board_data.get('user_rank_map', {}).get(current_user_id)
+                if current_user_rank is None:
+                    # Not ranked when the board was built: rank against current data
+                    current_user_rank, current_user_data = self._find_live_user_rank(current_user_id, period, now)
+                elif current_user_rank <= len(stored_entries):
+                    current_user_data = stored_entries[current_user_rank - 1]
+                else:
+                    # Ranked below the stored entries: only the profile is missing
+                    current_user_data = self._build_ranked_user_entry(current_user_id, current_user_rank, period)
             
-            # Sort by XP
-            sorted_users = sorted(user_scores.items(), key=lambda x: x[1]['xp'], reverse=True)
+            return {
+                'scope': scope,
+                'period': period,
+                'entries': entries,
+                'current_user': {
+                    'rank': current_user_rank,
+                    'data': current_user_data
+                } if current_user_data else None,
+                'total_entries': len(entries),
+                'updated_at': built_at
+            }
             
-            for rank, (user_id, score_data) in enumerate(sorted_users[:limit], 1):
-                # Get user profile
-                user_doc = self.users_ref.document(user_id).get()
-                if user_doc.exists:
-                    user_data = user_doc.to_dict()
-                    
-                    entry = {
-                        'rank': rank,
-                        'user_id': user_id,
-                        'name': user_data.get('name', 'EcoWarrior'),
-                        'xp': score_data['xp'],
-                        'level': user_data.get('level', 1),
-                        'badges': len(user_data.get('badges', [])),
-                        'avatar_url': user_data.get('avatar_url', ''),
-                        'period_attempts': score_data['attempts'],
-                        'average_score': score_data['total_score'] / score_data['attempts'] if score_data['attempts'] > 0 else 0
-                    }
-                    
-                    entries.append(entry)
-                    
-                    if user_id == current_user_id:
-                        current_user_rank = rank
-                        current_user_data = entry
+        except Exception as e:
+            logger.error(f"Error reading materialized leaderboard: {str(e)}")
+            return None
+    
+    def rebuild(self, scope='global', period='all'):
+        """
+        Recompute a leaderboard and store it in leaderboards/{scope}_{period}
+        (scheduled task) with a user_id -> rank map for O(1) rank lookups
+        """
+        try:
+            if scope != 'global':
+                raise ValueError("Only global leaderboards can be materialized")
             
-            # Find current user rank if not in top results
-            if current_user_id and current_user_rank is None:
-                user_rank = 1
-                for user_id, score_data in sorted_users:
-                    if user_id == current_user_id:
-                        user_doc = self.users_ref.document(user_id).get()
-                        if user_doc.exists:
-                            user_data = user_doc.to_dict()
-                            current_user_data = {
-                                'rank': user_rank,
-                                'user_id': user_id,
-                                'name': user_data.get('name', 'EcoWarrior'),
-                                'xp': score_data['xp'],
-                                'level': user_data.get('level', 1),
-                                'badges': len(user_data.get('badges', [])),
-                                'period_attempts': score_data['attempts']
-                            }
-                            current_user_rank = user_rank
-                        break
-                    user_rank += 1
+            now = datetime.utcnow()
             
-            return entries, current_user_rank, current_user_data
+            if period == 'all':
+                ranked_docs = list(
+                    self.users_ref.select(LEADERBOARD_PROFILE_FIELDS)
+                    .order_by('xp', direction='DESCENDING').limit(MATERIALIZED_RANK_LIMIT).stream()
+                )
+                entries = [
+                    self._build_user_entry(rank, user_doc.id, user_doc.to_dict())
+                    for rank, user_doc in enumerate(ranked_docs[:MATERIALIZED_ENTRY_LIMIT], 1)
+                ]
+                ranked_ids = [user_doc.id for user_doc in ranked_docs]
+                # Resync the Redis ranking with Firestore (covers users who have not scored since it was enabled)
+                self._set_redis_scores({user_doc.id: user_doc.get('xp') or 0 for user_doc in ranked_docs})
+            elif period in COUNTER_PERIODS:
+                ranked_entries, _, _ = self._get_counter_period_leaderboard(period, MATERIALIZED_RANK_LIMIT, None, now)
+                entries = ranked_entries[:MATERIALIZED_ENTRY_LIMIT]
+                ranked_ids = [entry['user_id'] for entry in ranked_entries]
+            else:
+                raise ValueError("Invalid leaderboard period")
+            
+            self.leaderboards_ref.document(f'{scope}_{period}').set({
+                'scope': scope,
+                'period': period,
+                'period_key': get_period_key(period, now),
+                'entries': entries,
+                'user_rank_map': {user_id: rank for rank, user_id in enumerate(ranked_ids, 1)},
+                'truncated': len(entries) >= MATERIALIZED_ENTRY_LIMIT,
+                'updated_at': now
+            })
+            
+            logger.info(f"Rebuilt {scope} {period} leaderboard with {len(ranked_ids)} ranked users")
+            return True
             
         except Exception as e:
-            logger.error(f"Error getting period leaderboard: {str(e)}")
-            return [], None, None
+            logger.error(f"Error rebuilding leaderboard: {str(e)}")
+            return False
     
     def _get_school_leaderboard(self, period, limit, current_user_id):
         """
@@ -217,24 +530,69 @@ class LeaderboardService:
             'updated_at': datetime.utcnow()
         }
     
+    def _get_ranked_user_ids(self, limit):
+        """
+        Top user ids by XP from the Redis sorted set; None when Redis is not
+        configured, unavailable or not yet populated
+        """
+        if self.redis is None:
+            return None
+        
+        try:
+            user_ids = self.redis.zrevrange(XP_RANKING_KEY, 0, limit - 1)
+        except Exception as e:
+            logger.error(f"Error reading XP ranking: {str(e)}")
+            return None
+        
+        return [user_id.decode() for user_id in user_ids] or None
+    
+    def _get_redis_rank(self, user_id):
+        """
+        1-based XP rank of a user from the Redis sorted set, or None
+        """
+        if self.redis is None:
+            return None
+        
+        try:
+            rank = self.redis.zrevrank(XP_RANKING_KEY, user_id)
+        except Exception as e:
+            logger.error(f"Error reading XP rank: {str(e)}")
+            return None
+        
+        return rank + 1 if rank is not None else None
+    
+    def _set_redis_scores(self, scores):
+        """
+        Record {user_id: xp} in the Redis sorted set (no-op without Redis)
+        """
+        if self.redis is None or not scores:
+            return
+        
+        try:
+            self.redis.zadd(XP_RANKING_KEY, scores)
+        except Exception as e:
+            logger.error(f"Error updating XP ranking: {str(e)}")
+    
     def _find_user_rank(self, user_id, field='xp'):
         """
         Find a user's rank in the global leaderboard
         """
         try:
-            user_doc = self.users_ref.document(user_id).get()
+            user_doc, rank = run_parallel(
+                lambda: self.users_ref.document(user_id).get(field_paths=list({*LEADERBOARD_PROFILE_FIELDS, field})),
+                lambda: self._get_redis_rank(user_id) if field == 'xp' else None
+            )
             if not user_doc.exists:
                 return None, None
             
             user_data = user_doc.to_dict()
             user_score = user_data.get(field, 0)
             
-            # Count users with higher scores
-            higher_scores_count = len(list(
-                self.users_ref.where(field, '>', user_score).stream()
-            ))
-            
-            rank = higher_scores_count + 1
+            if rank is None:
+                # Count users with higher scores server-side instead of streaming them
+                higher_scores_count = self.users_ref.where(field, '>', user_score).count().get()
+                
+                rank = higher_scores_count[0][0].value + 1
             
             return rank, {
                 'rank': rank,
@@ -250,69 +608,15 @@ class LeaderboardService:
             logger.error(f"Error finding user rank: {str(e)}")
             return None, None
     
-    def _get_time_filter(self, period):
-        """
-        Get datetime filter for period-based queries
-        """
-        now = datetime.utcnow()
-        
-        if period == 'weekly':
-            return now - timedelta(days=7)
-        elif period == 'monthly':
-            return now - timedelta(days=30)
-        elif period == 'daily':
-            return now - timedelta(days=1)
-        else:
-            return datetime.min  # All time
-    
     def update_user_leaderboard_position(self, user_id, xp, level):
         """
-        Update user's position in cached leaderboards
+        Update user's position in the live XP ranking
         """
         try:
-            # Update global leaderboard cache
-            global_board_ref = self.leaderboards_ref.document('global')
-            global_doc = global_board_ref.get()
-            
-            user_entry = {
-                'user_id': user_id,
-                'xp': xp,
-                'level': level,
-                'updated_at': datetime.utcnow()
-            }
-            
-            if global_doc.exists:
-                board_data = global_doc.to_dict()
-                entries = board_data.get('entries', [])
-                
-                # Find and update user entry
-                user_found = False
-                for i, entry in enumerate(entries):
-                    if entry.get('user_id') == user_id:
-                        entries[i] = {**entry, **user_entry}
-                        user_found = True
-                        break
-                
-                # Add new user if not found
-                if not user_found:
-                    entries.append(user_entry)
-                
-                # Sort by XP and limit to top 1000
-                entries.sort(key=lambda x: x.get('xp', 0), reverse=True)
-                entries = entries[:1000]
-                
-                global_board_ref.update({
-                    'entries': entries,
-                    'updated_at': datetime.utcnow()
-                })
-            else:
-                # Create new leaderboard
-                global_board_ref.set({
-                    'scope': 'global',
-                    'entries': [user_entry],
-                    'created_at': datetime.utcnow(),
-                    'updated_at': datetime.utcnow()
-                })
+            # Rankings are read from the users collection (ordered queries, the
+            # scheduled rebuild) so only the Redis sorted set needs updating here;
+            # an O(log N) write with no shared Firestore document to contend on
+            self._set_redis_scores({user_id: xp})
             
             logger.info(f"Updated leaderboard position for user: {user_id}")
             
@@ -324,15 +628,19 @@ class LeaderboardService:
         Get overall leaderboard statistics
         """
         try:
-            # Count total active users
-            total_users = len(list(self.users_ref.where('xp', '>', 0).stream()))
+            # The three reads are independent, so overlap their round-trips
+            active_count, top_users, totals_result = run_parallel(
+                # Count total active users server-side
+                lambda: self.users_ref.where('xp', '>', 0).count().get(),
+                self._get_top_users,
+                lambda: self.users_ref.count(alias='user_count').sum('xp', alias='total_xp').get()
+            )
+            total_users = active_count[0][0].value
             
             # Get top performer
-            top_user_query = self.users_ref.order_by('xp', direction='DESCENDING').limit(1)
             top_user_data = None
             
-            for user_doc in top_user_query.stream():
-                user_data = user_doc.to_dict()
+            for user_data in top_users:
                 top_user_data = {
                     'name': user_data.get('name', 'EcoWarrior'),
                     'xp': user_data.get('xp', 0),
@@ -340,13 +648,10 @@ class LeaderboardService:
                 }
                 break
             
-            # Calculate average XP
-            total_xp = 0
-            user_count = 0
-            for user_doc in self.users_ref.stream():
-                user_data = user_doc.to_dict()
-                total_xp += user_data.get('xp', 0)
-                user_count += 1
+            # Calculate average XP with one count + sum aggregation instead of reading every user
+            totals = {result.alias: result.value for result in totals_result[0]}
+            total_xp = totals['total_xp'] or 0
+            user_count = totals['user_count']
             
             average_xp = total_xp / user_count if user_count > 0 else 0
             
@@ -361,6 +666,18 @@ class LeaderboardService:
             logger.error(f"Error getting leaderboard stats: {str(e)}")
             raise ValueError(f"Failed to get leaderboard stats: {str(e)}")
     
+    def _get_top_users(self):
+        """
+        Profile of the top user by XP, from the Redis ranking when it is available
+        """
+        top_user_fields = ['name', 'xp', 'level']
+        top_user_ids = self._get_ranked_user_ids(1)
+        if top_user_ids:
+            return list(self._fetch_users_batch(top_user_ids, top_user_fields).values())
+        
+        top_user_query = self.users_ref.select(top_user_fields).order_by('xp', direction='DESCENDING').limit(1)
+        return [user_doc.to_dict() for user_doc in top_user_query.stream()]
+    
     def reset_periodic_leaderboards(self, period='weekly'):
         """
         Reset periodic leaderboards (scheduled task)
@@ -369,15 +686,16 @@ class LeaderboardService:
             # This would be called by a scheduled cloud function
             # to reset weekly/monthly leaderboards
             
-            leaderboard_doc = f"{period}_leaderboard_{datetime.utcnow().strftime('%Y_%m_%d')}"
+            now = datetime.utcnow()
+            leaderboard_doc = f"{period}_leaderboard_{now.strftime('%Y_%m_%d')}"
             
             # Archive current period leaderboard
-            current_board = self._get_global_leaderboard(period, 100, None)
+            current_board = self._compute_global_leaderboard(period, 100, None, now)
             
             archived_ref = self.leaderboards_ref.document(f'archived_{leaderboard_doc}')
             archived_ref.set({
                 **current_board,
-                'archived_at': datetime.utcnow()
+                'archived_at': now
             })
             
             logger.info(f"Archived {period} leaderboard: {leaderboard_doc}")
@@ -3,91 +3,188 @@ Quiz Service for EcoLearn Platform
 Handles quiz management, submission, grading, and analytics
 """
 
+from firebase_admin import firestore
 from datetime import datetime
 import uuid
 import logging
+import operator
+import os
+
+from utils.batch import commit_in_parallel
+from utils.cache import TTLCache, user_cache
 
 logger = logging.getLogger(__name__)
 
+# The active-quiz list is shared by every client, so keep it fresher than single quizzes
+QUIZ_LIST_CACHE_TTL = 60
+
+# Fields read for the quiz catalog listing
+QUIZ_CATALOG_FIELDS = [
+    'title', 'description', 'difficulty', 'category', 'questions_public',
+    'points_per_question', 'time_limit_minutes', 'created_at'
+]
+
+# Question fields exposed to clients, with their defaults
+PUBLIC_QUESTION_FIELDS = (
+    ('id', None),
+    ('question', None),
+    ('options', []),
+    ('difficulty', 'medium'),
+    ('category', 'general')
+)
+
+# Quiz attempt history page sizes
+ATTEMPTS_PAGE_SIZE = 50
+MAX_ATTEMPTS_PAGE_SIZE = 100
+
+# Joins the timestamp and attempt id in a page cursor (neither contains it)
+ATTEMPTS_CURSOR_SEPARATOR = '~'
+
+# Fields every submitted question must provide
+REQUIRED_QUESTION_FIELDS = frozenset(('question', 'options', 'correct'))
+
+def score_answers(correct_options, user_answers):
+    """
+    Scoring kernel: per-question correctness for two aligned answer sequences,
+    compared in one C-level pass (also used for bulk regrading)
+    """
+    return list(map(operator.eq, user_answers, correct_options))
+
+def generate_uuids(count):
+    """
+    Generate count random (version 4) UUID strings from a single urandom read
+    """
+    raw = os.urandom(16 * count)
+    return [str(uuid.UUID(bytes=raw[i:i + 16], version=4)) for i in range(0, 16 * count, 16)]
+
 class QuizService:
     def __init__(self, db):
         self.db = db
         self.quizzes_ref = db.collection('quizzes')
         self.attempts_ref = db.collection('attempts')
         self.users_ref = db.collection('users')
+        # Sanitized catalog responses; quizzes change rarely
+        self._catalog_cache = TTLCache(maxsize=256, ttl=300)
+        # Per-quiz graders with the answer key baked in
+        self._grader_cache = TTLCache(maxsize=256, ttl=300)
+        # Full quizzes (with answers) for grading; long enough to cover a quiz's time limit
+        self._full_quiz_cache = TTLCache(maxsize=512, ttl=1800)
     
     def get_all_quizzes(self):
         """
         Get all available quizzes (without answers)
         """
         try:
-            quizzes = []
-            quiz_docs = self.quizzes_ref.where('status', '==', 'active').stream()
-            
-            for quiz_doc in quiz_docs:
-                quiz_data = quiz_doc.to_dict()
-                
-                # Remove correct answers from questions for security
-                sanitized_questions = []
-                for question in quiz_data.get('questions', []):
-                    sanitized_question = {
-                        'id': question.get('id'),
-                        'question': question.get('question'),
-                        'options': question.get('options', []),
-                        'difficulty': question.get('difficulty', 'medium'),
-                        'category': question.get('category', 'general')
-                    }
-                    sanitized_questions.append(sanitized_question)
-                
-                quiz_summary = {
-                    'id': quiz_doc.id,
-                    'title': quiz_data.get('title'),
-                    'description': quiz_data.get('description'),
-                    'difficulty': quiz_data.get('difficulty'),
-                    'category': quiz_data.get('category'),
-                    'questions': sanitized_questions,
-                    'total_questions': len(sanitized_questions),
-                    'points_per_question': quiz_data.get('points_per_question', 10),
-                    'time_limit_minutes': quiz_data.get('time_limit_minutes'),
-                    'created_at': quiz_data.get('created_at')
-                }
-                
-                quizzes.append(quiz_summary)
-            
-            # Sort by creation date (newest first)
-            quizzes.sort(key=lambda x: x.get('created_at', datetime.min), reverse=True)
-            
-            return quizzes
+            return list(self.iter_all_quizzes())
             
         except Exception as e:
             logger.error(f"Error getting all quizzes: {str(e)}")
             raise ValueError(f"Failed to get quizzes: {str(e)}")
     
+    def iter_all_quizzes(self):
+        """
+        Yield available quizzes (without answers), newest first, as Firestore
+        streams them; the full list is cached once the stream completes
+        """
+        cached = self._catalog_cache.get('all')
+        if cached is not None:
+            yield from cached
+            return
+        
+        # Project only the catalog fields; answers and explanations stay on the server
+        quiz_docs = (
+            self.quizzes_ref.where('status', '==', 'active')
+            .order_by('created_at', direction='DESCENDING')
+            .select(QUIZ_CATALOG_FIELDS)
+            .stream()
+        )
+        
+        quizzes = []
+        for quiz_doc in quiz_docs:
+            quiz_summary = self._build_quiz_summary(quiz_doc)
+            quizzes.append(quiz_summary)
+            yield quiz_summary
+        
+        self._catalog_cache.set('all', quizzes, ttl=QUIZ_LIST_CACHE_TTL)
+    
+    def _build_quiz_summary(self, quiz_doc):
+        """
+        Build the catalog entry for a quiz document (without answers)
+        """
+        quiz_data = quiz_doc.to_dict()
+        if 'questions_public' not in quiz_data:
+            # Quiz predates questions_public: the projection left out its questions.
+            # Store the derived view so later catalog reads don't need this extra read
+            quiz_data = quiz_doc.reference.get().to_dict()
+            quiz_data['questions_public'] = self._build_public_questions(quiz_data.get('questions', []))
+            try:
+                quiz_doc.reference.update({'questions_public': quiz_data['questions_public']})
+            except Exception as e:
+                logger.error(f"Error backfilling public questions for quiz {quiz_doc.id}: {str(e)}")
+        
+        # Public view without answers, precomputed when the quiz was written
+        sanitized_questions = self._get_public_questions(quiz_data)
+        
+        return {
+            'id': quiz_doc.id,
+            'title': quiz_data.get('title'),
+            'description': quiz_data.get('description'),
+            'difficulty': quiz_data.get('difficulty'),
+            'category': quiz_data.get('category'),
+            'questions': sanitized_questions,
+            'total_questions': len(sanitized_questions),
+            'points_per_question': quiz_data.get('points_per_question', 10),
+            'time_limit_minutes': quiz_data.get('time_limit_minutes'),
+            'created_at': quiz_data.get('created_at')
+        }
+    
+    def _get_public_questions(self, quiz_data):
+        """
+        Return the stored questions_public view, deriving it for quizzes
+        written before the field existed
+        """
+        if 'questions_public' in quiz_data:
+            return quiz_data['questions_public']
+        
+        return self._build_public_questions(quiz_data.get('questions', []))
+    
+    def _build_public_questions(self, questions):
+        """
+        Build the client-facing questions (answers and explanations removed)
+        """
+        public_questions = []
+        for question in questions:
+            public_question = {key: question.get(key, default) for key, default in PUBLIC_QUESTION_FIELDS}
+            
+            explanation = question.get('explanation', '')
+            public_question['explanation_preview'] = explanation[:100] + '...' if len(explanation) > 100 else explanation
+            
+            public_questions.append(public_question)
+        
+        return public_questions
+    
     def get_quiz_by_id(self, quiz_id):
         """
         Get specific quiz by ID (without answers)
         """
         try:
+            cached = self._catalog_cache.get(('quiz', quiz_id))
+            if cached is not None:
+                return cached
+            
             quiz_doc = self.quizzes_ref.document(quiz_id).get()
             if not quiz_doc.exists:
                 raise ValueError("Quiz not found")
             
             quiz_data = quiz_doc.to_dict()
             
-            # Remove answers for security
-            sanitized_questions = []
-            for question in quiz_data.get('questions', []):
-                sanitized_question = {
-                    'id': question.get('id'),
-                    'question': question.get('question'),
-                    'options': question.get('options', []),
-                    'difficulty': question.get('difficulty', 'medium'),
-                    'category': question.get('category', 'general'),
-                    'explanation_preview': question.get('explanation', '')[:100] + '...' if len(question.get('explanation', '')) > 100 else question.get('explanation', '')
-                }
-                sanitized_questions.append(sanitized_question)
+            # Keep the full quiz around for the submission that usually follows
+            self._full_quiz_cache.set(quiz_id, quiz_data)
             
-            return {
+            # Public view without answers, precomputed when the quiz was written
+            sanitized_questions = self._get_public_questions(quiz_data)
+            
+            quiz = {
                 'id': quiz_doc.id,
                 'title': quiz_data.get('title'),
                 'description': quiz_data.get('description'),
@@ -99,115 +196,200 @@ class QuizService:
                 'total_questions': len(sanitized_questions)
             }
             
+            self._catalog_cache.set(('quiz', quiz_id), quiz)
+            return quiz
+            
         except Exception as e:
             logger.error(f"Error getting quiz by ID: {str(e)}")
             raise ValueError(f"Failed to get quiz: {str(e)}")
     
-    def submit_quiz(self, user_id, quiz_id, answers):
+    def submit_quiz_and_update_stats(self, user_id, quiz_id, answers, user_service):
         """
-        Submit quiz answers and return graded results
+        Submit quiz answers and apply the attempt, quiz statistics and
+        user stats in a single Firestore transaction
         """
         try:
-            # Get quiz with correct answers
-            quiz_doc = self.quizzes_ref.document(quiz_id).get()
-            if not quiz_doc.exists:
-                raise ValueError("Quiz not found")
-            
-            quiz_data = quiz_doc.to_dict()
-            questions = quiz_data.get('questions', [])
-            points_per_question = quiz_data.get('points_per_question', 10)
-            
-            # Grade the quiz
-            results = self._grade_quiz(questions, answers, points_per_question)
-            
-            # Calculate XP earned (base XP + bonuses)
-            base_xp = results['correct_answers'] * 10
-            bonus_xp = 0
-            
-            # Perfect score bonus
-            if results['score_percentage'] == 100:
-                bonus_xp += 20
-            # High score bonus (80%+)
-            elif results['score_percentage'] >= 80:
-                bonus_xp += 10
+            quiz_ref = self.quizzes_ref.document(quiz_id)
+            user_ref = self.users_ref.document(user_id)
             
-            total_xp = base_xp + bonus_xp
+            # Quiz content is read-only here (stats are increments), so it can come
+            # from the cache and stays out of the transaction's read set
+            quiz_data = self._get_full_quiz(quiz_id)
             
-            # Create attempt record
-            attempt_data = {
-                'id': str(uuid.uuid4()),
-                'user_id': user_id,
-                'quiz_id': quiz_id,
-                'quiz_title': quiz_data.get('title'),
-                'answers': answers,
-                'score': results['correct_answers'],
-                'total_questions': results['total_questions'],
-                'score_percentage': results['score_percentage'],
-                'earned_xp': total_xp,
-                'time_taken_seconds': answers.get('time_taken_seconds', 0),
-                'question_results': results['question_results'],
-                'created_at': datetime.utcnow()
-            }
+            @firestore.transactional
+            def _submit(transaction):
+                user_doc = user_ref.get(transaction=transaction)
+                if not user_doc.exists:
+                    raise ValueError("User not found")
+                
+                attempt_data, result = self._build_attempt(user_id, quiz_id, quiz_data, answers)
+                user_update, user_stats = user_service.build_quiz_stats_update(
+                    user_id, user_doc.to_dict(), result
+                )
+                
+                transaction.set(self.attempts_ref.document(attempt_data['id']), attempt_data)
+                transaction.update(quiz_ref, self._calculate_quiz_stats(result['score_percentage'], attempt_data['created_at']))
+                transaction.update(user_ref, user_update)
+                
+                return result, user_stats
             
-            # Save attempt to Firestore
-            self.attempts_ref.add(attempt_data)
+            result, user_stats = _submit(self.db.transaction())
+            user_cache.pop(user_id)
             
-            # Update quiz statistics
-            self._update_quiz_stats(quiz_id, results['score_percentage'])
+            # The live XP ranking (Redis) is not transactional; push it once the commit lands
+            user_service.update_user_leaderboard_position(user_id, user_stats['new_xp'], user_stats['new_level'])
             
-            logger.info(f"Quiz submitted - User: {user_id}, Quiz: {quiz_id}, Score: {results['score_percentage']}%")
+            logger.info(f"Quiz submitted - User: {user_id}, Quiz: {quiz_id}, Score: {result['score_percentage']}%")
             
-            return {
-                'attempt_id': attempt_data['id'],
-                'score': results['correct_answers'],
-                'total_questions': results['total_questions'],
-                'score_percentage': results['score_percentage'],
-                'earned_xp': total_xp,
-                'base_xp': base_xp,
-                'bonus_xp': bonus_xp,
-                'question_results': results['question_results'],
-                'quiz_completed': True
-            }
+            return result
             
         except Exception as e:
             logger.error(f"Error submitting quiz: {str(e)}")
             raise ValueError(f"Failed to submit quiz: {str(e)}")
     
-    def get_user_quiz_attempts(self, user_id, quiz_id=None):
+    def _get_full_quiz(self, quiz_id):
+        """
+        Get quiz data including answers, from the cache when the quiz was read recently
+        """
+        quiz_data = self._full_quiz_cache.get(quiz_id)
+        if quiz_data is None:
+            quiz_doc = self.quizzes_ref.document(quiz_id).get()
+            if not quiz_doc.exists:
+                raise ValueError("Quiz not found")
+            
+            quiz_data = quiz_doc.to_dict()
+            self._full_quiz_cache.set(quiz_id, quiz_data)
+        
+        return quiz_data
+    
+    def _build_attempt(self, user_id, quiz_id, quiz_data, answers):
+        """
+        Grade answers against quiz data and build the attempt record and response
+        """
+        questions = quiz_data.get('questions', [])
+        points_per_question = quiz_data.get('points_per_question', 10)
+        
+        # Grade the quiz
+        results = self._grade_quiz(questions, answers, points_per_question, quiz_id=quiz_id)
+        
+        # Calculate XP earned (base XP + bonuses)
+        base_xp = results['correct_answers'] * 10
+        bonus_xp = 0
+        
+        # Perfect score bonus
+        if results['score_percentage'] == 100:
+            bonus_xp += 20
+        # High score bonus (80%+)
+        elif results['score_percentage'] >= 80:
+            bonus_xp += 10
+        
+        total_xp = base_xp + bonus_xp
+        
+        # Create attempt record
+        attempt_data = {
+            'id': str(uuid.uuid4()),
+            'user_id': user_id,
+            'quiz_id': quiz_id,
+            'quiz_title': quiz_data.get('title'),
+            'answers': answers,
+            'score': results['correct_answers'],
+            'total_questions': results['total_questions'],
+            'score_percentage': results['score_percentage'],
+            'earned_xp': total_xp,
+            'time_taken_seconds': answers.get('time_taken_seconds', 0),
+            'question_results': results['question_results'],
+            'created_at': datetime.utcnow()
+        }
+        
+        return attempt_data, {
+            'attempt_id': attempt_data['id'],
+            'score': results['correct_answers'],
+            'total_questions': results['total_questions'],
+            'score_percentage': results['score_percentage'],
+            'earned_xp': total_xp,
+            'base_xp': base_xp,
+            'bonus_xp': bonus_xp,
+            'question_results': results['question_results'],
+            'quiz_completed': True
+        }
+    
+    def get_user_quiz_attempts(self, user_id, quiz_id=None, limit=ATTEMPTS_PAGE_SIZE, start_after=None):
         """
-        Get user's quiz attempts, optionally filtered by quiz_id
+        Get one page of user's quiz attempts (newest first), optionally filtered
+        by quiz_id; pass the returned next_cursor as start_after for the next page
         """
         try:
-            query = self.attempts_ref.where('user_id', '==', user_id)
+            limit = max(1, min(limit, MAX_ATTEMPTS_PAGE_SIZE))
+            if start_after:
+                start_after = self._parse_attempts_cursor(start_after)
             
-            if quiz_id:
-                query = query.where('quiz_id', '==', quiz_id)
+            attempts = list(self.iter_user_quiz_attempts(user_id, quiz_id, limit, start_after))
             
-            attempts = []
-            for attempt_doc in query.order_by('created_at', direction='DESCENDING').stream():
-                attempt_data = attempt_doc.to_dict()
-                
-                # Remove sensitive data
-                sanitized_attempt = {
-                    'id': attempt_data.get('id'),
-                    'quiz_id': attempt_data.get('quiz_id'),
-                    'quiz_title': attempt_data.get('quiz_title'),
-                    'score': attempt_data.get('score'),
-                    'total_questions': attempt_data.get('total_questions'),
-                    'score_percentage': attempt_data.get('score_percentage'),
-                    'earned_xp': attempt_data.get('earned_xp'),
-                    'time_taken_seconds': attempt_data.get('time_taken_seconds'),
-                    'created_at': attempt_data.get('created_at')
-                }
-                
-                attempts.append(sanitized_attempt)
+            # A full page may have more behind it; the cursor is the last attempt's timestamp
+            # and id, so attempts sharing that timestamp are not skipped
+            next_cursor = None
+            if len(attempts) == limit and attempts[-1].get('created_at'):
+                next_cursor = f"{attempts[-1]['created_at'].isoformat()}{ATTEMPTS_CURSOR_SEPARATOR}{attempts[-1]['id']}"
             
-            return attempts
+            return {
+                'attempts': attempts,
+                'next_cursor': next_cursor
+            }
             
         except Exception as e:
             logger.error(f"Error getting user quiz attempts: {str(e)}")
             raise ValueError(f"Failed to get quiz attempts: {str(e)}")
     
+    def _parse_attempts_cursor(self, cursor):
+        """
+        Turn a next_cursor string back into start_after values; cursors without
+        an attempt id (timestamp only) are still accepted
+        """
+        created_at, _, attempt_id = cursor.partition(ATTEMPTS_CURSOR_SEPARATOR)
+        start_after = {'created_at': datetime.fromisoformat(created_at)}
+        if attempt_id:
+            start_after['__name__'] = attempt_id
+        return start_after
+    
+    def iter_user_quiz_attempts(self, user_id, quiz_id=None, limit=None, start_after=None):
+        """
+        Yield user's sanitized quiz attempts (newest first) as Firestore streams them,
+        optionally only `limit` attempts after the `start_after` cursor values
+        ({'created_at': ..., '__name__': attempt_id})
+        """
+        query = self.attempts_ref.where('user_id', '==', user_id)
+        
+        if quiz_id:
+            query = query.where('quiz_id', '==', quiz_id)
+        
+        # Document id breaks ties between attempts with the same timestamp
+        query = (
+            query.order_by('created_at', direction='DESCENDING')
+            .order_by('__name__', direction='DESCENDING')
+        )
+        
+        if start_after:
+            query = query.start_after(start_after)
+        
+        if limit:
+            query = query.limit(limit)
+        
+        for attempt_doc in query.stream():
+            attempt_data = attempt_doc.to_dict()
+            
+            # Remove sensitive data
+            yield {
+                'id': attempt_doc.id,
+                'quiz_id': attempt_data.get('quiz_id'),
+                'quiz_title': attempt_data.get('quiz_title'),
+                'score': attempt_data.get('score'),
+                'total_questions': attempt_data.get('total_questions'),
+                'score_percentage': attempt_data.get('score_percentage'),
+                'earned_xp': attempt_data.get('earned_xp'),
+                'time_taken_seconds': attempt_data.get('time_taken_seconds'),
+                'created_at': attempt_data.get('created_at')
+            }
+    
     def create_quiz(self, created_by, title, description, difficulty, questions, points_per_question=10):
         """
         Create a new quiz (teacher/admin function)
@@ -217,13 +399,14 @@ class QuizService:
             if not questions or len(questions) == 0:
                 raise ValueError("Quiz must have at least one question")
             
+            question_ids = generate_uuids(len(questions))
             validated_questions = []
             for i, question in enumerate(questions):
-                if not all(key in question for key in ['question', 'options', 'correct']):
+                if not REQUIRED_QUESTION_FIELDS <= question.keys():
                     raise ValueError(f"Question {i+1} is missing required fields")
                 
                 validated_question = {
-                    'id': str(uuid.uuid4()),
+                    'id': question_ids[i],
                     'question': question['question'],
                     'options': question['options'],
                     'correct': question['correct'],
@@ -233,25 +416,31 @@ class QuizService:
                 }
                 validated_questions.append(validated_question)
             
+            now = datetime.utcnow()
             quiz_data = {
                 'title': title,
                 'description': description,
                 'difficulty': difficulty,
                 'category': 'environmental',
                 'questions': validated_questions,
+                'questions_public': self._build_public_questions(validated_questions),
                 'points_per_question': points_per_question,
                 'time_limit_minutes': 30,  # Default 30 minutes
                 'created_by': created_by,
                 'status': 'active',
                 'total_attempts': 0,
-                'average_score': 0,
-                'created_at': datetime.utcnow(),
-                'updated_at': datetime.utcnow()
+                'score_sum': 0,
+                'created_at': now,
+                'updated_at': now
             }
             
-            # Save to Firestore
-            quiz_ref = self.quizzes_ref.add(quiz_data)
-            quiz_id = quiz_ref[1].id
+            # Save to Firestore: questions are embedded, so the whole quiz is a single write
+            quiz_ref = self.quizzes_ref.document()
+            quiz_ref.set(quiz_data)
+            quiz_id = quiz_ref.id
+            self._catalog_cache.clear()
+            self._grader_cache.clear()
+            self._full_quiz_cache.clear()
             
             logger.info(f"Created new quiz: {title} by user {created_by}")
             
@@ -266,32 +455,30 @@ class QuizService:
             logger.error(f"Error creating quiz: {str(e)}")
             raise ValueError(f"Failed to create quiz: {str(e)}")
     
-    def _grade_quiz(self, questions, answers, points_per_question):
+    def _grade_quiz(self, questions, answers, points_per_question, detailed=True, quiz_id=None):
         """
-        Grade quiz answers against correct answers
+        Grade quiz answers against correct answers; per-question results
+        are only built when detailed is set
         """
-        correct_answers = 0
-        question_results = []
+        grader = self._get_grader(quiz_id, questions) if quiz_id else self._compile_grader(questions)
+        question_ids, correct_options, user_answers, is_correct = grader(answers)
+        correct_answers = sum(is_correct)
         
-        for question in questions:
-            question_id = question.get('id')
-            correct_option = question.get('correct')
-            user_answer = answers.get(question_id)
-            
-            is_correct = user_answer == correct_option
-            if is_correct:
-                correct_answers += 1
-            
-            question_result = {
-                'question_id': question_id,
-                'question': question.get('question'),
-                'correct_answer': correct_option,
-                'user_answer': user_answer,
-                'is_correct': is_correct,
-                'explanation': question.get('explanation', ''),
-                'points_earned': points_per_question if is_correct else 0
-            }
-            question_results.append(question_result)
+        question_results = []
+        if detailed:
+            question_results = [
+                {
+                    'question_id': question_id,
+                    'question': question.get('question'),
+                    'correct_answer': correct_option,
+                    'user_answer': user_answer,
+                    'is_correct': correct,
+                    'explanation': question.get('explanation', ''),
+                    'points_earned': points_per_question if correct else 0
+                }
+                for question, question_id, correct_option, user_answer, correct
+                in zip(questions, question_ids, correct_options, user_answers, is_correct)
+            ]
         
         total_questions = len(questions)
         score_percentage = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
@@ -303,32 +490,40 @@ class QuizService:
             'question_results': question_results
         }
     
-    def _update_quiz_stats(self, quiz_id, score_percentage):
+    def _get_grader(self, quiz_id, questions):
         """
-        Update quiz statistics after submission
+        Return the grader for a quiz, compiling it on first use
         """
-        try:
-            quiz_ref = self.quizzes_ref.document(quiz_id)
-            quiz_doc = quiz_ref.get()
-            
-            if quiz_doc.exists:
-                quiz_data = quiz_doc.to_dict()
-                current_attempts = quiz_data.get('total_attempts', 0)
-                current_avg = quiz_data.get('average_score', 0)
-                
-                # Calculate new average
-                new_attempts = current_attempts + 1
-                new_average = ((current_avg * current_attempts) + score_percentage) / new_attempts
-                
-                # Update quiz document
-                quiz_ref.update({
-                    'total_attempts': new_attempts,
-                    'average_score': round(new_average, 2),
-                    'updated_at': datetime.utcnow()
-                })
-                
-        except Exception as e:
-            logger.error(f"Error updating quiz stats: {str(e)}")
+        grader = self._grader_cache.get(quiz_id)
+        if grader is None:
+            grader = self._compile_grader(questions)
+            self._grader_cache.set(quiz_id, grader)
+        return grader
+    
+    def _compile_grader(self, questions):
+        """
+        Specialize grading to one quiz: question ids and correct options are
+        captured once, so each submission only looks up and compares answers
+        """
+        question_ids = tuple(question.get('id') for question in questions)
+        correct_options = tuple(question.get('correct') for question in questions)
+        
+        def grader(answers):
+            user_answers = list(map(answers.get, question_ids))
+            return question_ids, correct_options, user_answers, score_answers(correct_options, user_answers)
+        
+        return grader
+    
+    def _calculate_quiz_stats(self, score_percentage, now):
+        """
+        Build the quiz statistics update for one more attempt as server-side
+        increments (average score = score_sum / total_attempts)
+        """
+        return {
+            'total_attempts': firestore.Increment(1),
+            'score_sum': firestore.Increment(score_percentage),
+            'updated_at': now
+        }
     
     def seed_quizzes(self):
         """
@@ -347,7 +542,6 @@ class QuizService:
                     'created_by': 'system',
                     'questions': [
                         {
-                            'id': str(uuid.uuid4()),
                             'question': 'What percentage of plastic waste is currently recycled globally?',
                             'options': ['Less than 10%', 'About 25%', 'About 50%', 'Over 75%'],
                             'correct': 0,
@@ -356,7 +550,6 @@ class QuizService:
                             'category': 'waste'
                         },
                         {
-                            'id': str(uuid.uuid4()),
                             'question': 'Which renewable energy source produces the most electricity worldwide?',
                             'options': ['Solar', 'Wind', 'Hydroelectric', 'Geothermal'],
                             'correct': 2,
@@ -365,7 +558,6 @@ class QuizService:
                             'category': 'energy'
                         },
                         {
-                            'id': str(uuid.uuid4()),
                             'question': 'How much water can a leaky faucet waste per day?',
                             'options': ['1 gallon', '5 gallons', '10 gallons', '20+ gallons'],
                             'correct': 3,
@@ -374,7 +566,6 @@ class QuizService:
                             'category': 'water'
                         },
                         {
-                            'id': str(uuid.uuid4()),
                             'question': 'What is the main cause of deforestation worldwide?',
                             'options': ['Urban development', 'Agriculture', 'Mining', 'Natural disasters'],
                             'correct': 1,
@@ -383,7 +574,6 @@ class QuizService:
                             'category': 'forests'
                         },
                         {
-                            'id': str(uuid.uuid4()),
                             'question': 'Which transportation method has the lowest carbon footprint per kilometer?',
                             'options': ['Car', 'Bus', 'Train', 'Airplane'],
                             'correct': 2,
@@ -404,7 +594,6 @@ class QuizService:
                     'created_by': 'system',
                     'questions': [
                         {
-                            'id': str(uuid.uuid4()),
                             'question': 'What is the current atmospheric CO2 concentration?',
                             'options': ['350 ppm', '400 ppm', '420 ppm', '450 ppm'],
                             'correct': 2,
@@ -413,7 +602,6 @@ class QuizService:
                             'category': 'climate'
                         },
                         {
-                            'id': str(uuid.uuid4()),
                             'question': 'Which greenhouse gas has the highest global warming potential?',
                             'options': ['Carbon dioxide', 'Methane', 'Nitrous oxide', 'Fluorinated gases'],
                             'correct': 3,
@@ -425,14 +613,26 @@ class QuizService:
                 }
             ]
             
+            now = datetime.utcnow()
+            writes = []
             for quiz_data in sample_quizzes:
+                # Question ids for the whole quiz from one random read
+                for question, question_id in zip(quiz_data['questions'], generate_uuids(len(quiz_data['questions']))):
+                    question['id'] = question_id
+                quiz_data['questions_public'] = self._build_public_questions(quiz_data['questions'])
                 quiz_data['total_attempts'] = 0
-                quiz_data['average_score'] = 0
-                quiz_data['created_at'] = datetime.utcnow()
-                quiz_data['updated_at'] = datetime.utcnow()
+                quiz_data['score_sum'] = 0
+                quiz_data['created_at'] = now
+                quiz_data['updated_at'] = now
                 
-                self.quizzes_ref.add(quiz_data)
+                writes.append((self.quizzes_ref.document(), quiz_data))
+            
+            # Commit small WriteBatches concurrently instead of one RPC per quiz
+            commit_in_parallel(self.db, writes)
             
+            self._catalog_cache.clear()
+            self._grader_cache.clear()
+            self._full_quiz_cache.clear()
             logger.info("Seeded quiz database with sample data")
             return True
             
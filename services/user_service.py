@@ -3,28 +3,37 @@ User Service for EcoLearn Platform
 Handles user profile management, XP calculation, level progression
 """
 
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
 import math
 
+from services.leaderboard_service import COUNTER_PERIODS, get_period_key
+from utils.cache import user_cache
+
 logger = logging.getLogger(__name__)
 
 class UserService:
-    def __init__(self, db):
+    def __init__(self, db, leaderboard_service=None):
         self.db = db
         self.users_ref = db.collection('users')
         self.attempts_ref = db.collection('attempts')
+        # Optional LeaderboardService that keeps the live XP ranking in sync
+        self.leaderboard_service = leaderboard_service
     
     def get_user_profile(self, user_id):
         """
         Get complete user profile with calculated stats
         """
         try:
-            user_doc = self.users_ref.document(user_id).get()
-            if not user_doc.exists:
-                raise ValueError("User not found")
-            
-            user_data = user_doc.to_dict()
+            # Shared with AuthService and invalidated by every user-document write
+            user_data = user_cache.get(user_id)
+            if user_data is None:
+                user_doc = self.users_ref.document(user_id).get()
+                if not user_doc.exists:
+                    raise ValueError("User not found")
+                
+                user_data = user_doc.to_dict()
+                user_cache.set(user_id, user_data)
             
             # Calculate level progress
             current_level = user_data.get('level', 1)
@@ -42,8 +51,8 @@ class UserService:
                 'progress_percentage': min(100, ((current_xp - xp_for_current_level) / (xp_for_next_level - xp_for_current_level)) * 100)
             }
             
-            # Get recent activity stats
-            recent_stats = self._get_recent_activity_stats(user_id)
+            # Recent activity comes from the weekly counters kept on the user document
+            recent_stats = self._get_recent_activity_stats(user_data)
             
             # Update streak if needed
             self._update_user_streak(user_id, user_data)
@@ -82,6 +91,7 @@ class UserService:
             
             # Update in Firestore
             self.users_ref.document(user_id).update(filtered_data)
+            user_cache.pop(user_id)
             
             logger.info(f"Updated profile for user: {user_id}")
             
@@ -95,119 +105,113 @@ class UserService:
             logger.error(f"Error updating user profile: {str(e)}")
             raise ValueError(f"Failed to update profile: {str(e)}")
     
-    def update_user_stats_after_quiz(self, user_id, quiz_result):
+    def build_quiz_stats_update(self, user_id, user_data, quiz_result):
         """
-        Update user XP, level, and stats after quiz completion
+        Build the user document update for a quiz result without writing it,
+        so callers can apply it inside their own transaction
         """
-        try:
-            user_doc = self.users_ref.document(user_id).get()
-            if not user_doc.exists:
-                raise ValueError("User not found")
-            
-            user_data = user_doc.to_dict()
-            
-            # Calculate XP gained
-            xp_gained = quiz_result.get('earned_xp', 0)
-            new_xp = user_data.get('xp', 0) + xp_gained
-            
-            # Calculate new level
-            new_level = self._calculate_level_from_xp(new_xp)
-            old_level = user_data.get('level', 1)
-            
-            # Update stats
-            update_data = {
-                'xp': new_xp,
-                'level': new_level,
-                'points': user_data.get('points', 0) + quiz_result.get('score', 0),
-                'total_quizzes_completed': user_data.get('total_quizzes_completed', 0) + 1,
-                'last_active_date': datetime.utcnow(),
-                'updated_at': datetime.utcnow()
-            }
-            
-            # Handle level up
-            level_up_rewards = []
-            if new_level > old_level:
-                level_up_rewards = self._handle_level_up(user_id, old_level, new_level)
-                update_data['level_up_rewards'] = level_up_rewards
-            
-            # Update streak
-            streak_data = self._update_daily_streak(user_data)
-            update_data.update(streak_data)
-            
-            # Update in Firestore
-            self.users_ref.document(user_id).update(update_data)
-            
-            # Update leaderboard
-            self._update_user_leaderboard_position(user_id, new_xp, new_level)
-            
-            logger.info(f"Updated user stats after quiz: {user_id}, XP: {new_xp}, Level: {new_level}")
-            
-            return {
-                'xp_gained': xp_gained,
-                'new_xp': new_xp,
-                'new_level': new_level,
-                'level_up': new_level > old_level,
-                'level_up_rewards': level_up_rewards,
-                'streak_updated': streak_data.get('current_streak_days', 0)
-            }
-            
-        except Exception as e:
-            logger.error(f"Error updating user stats after quiz: {str(e)}")
-            raise ValueError(f"Failed to update user stats: {str(e)}")
+        # Calculate XP gained
+        xp_gained = quiz_result.get('earned_xp', 0)
+        new_xp = user_data.get('xp', 0) + xp_gained
+        
+        # Calculate new level
+        new_level = self._calculate_level_from_xp(new_xp)
+        old_level = user_data.get('level', 1)
+        
+        # Update stats
+        update_data = {
+            'xp': new_xp,
+            'level': new_level,
+            'points': user_data.get('points', 0) + quiz_result.get('score', 0),
+            'total_quizzes_completed': user_data.get('total_quizzes_completed', 0) + 1,
+            'last_active_date': datetime.utcnow(),
+            'updated_at': datetime.utcnow()
+        }
+        
+        # Handle level up
+        level_up_rewards = []
+        if new_level > old_level:
+            level_up_rewards = self._handle_level_up(user_id, old_level, new_level)
+            update_data['level_up_rewards'] = level_up_rewards
+        
+        # Update streak
+        streak_data = self._update_daily_streak(user_data)
+        update_data.update(streak_data)
+        
+        # Roll the weekly/monthly leaderboard counters
+        update_data.update(self._build_period_counters(user_data, xp_gained, quiz_result.get('score', 0)))
+        
+        logger.info(f"Updated user stats after quiz: {user_id}, XP: {new_xp}, Level: {new_level}")
+        
+        return update_data, {
+            'xp_gained': xp_gained,
+            'new_xp': new_xp,
+            'new_level': new_level,
+            'level_up': new_level > old_level,
+            'level_up_rewards': level_up_rewards,
+            'streak_updated': streak_data.get('current_streak_days', 0)
+        }
     
-    def update_user_stats_after_challenge(self, user_id, challenge_result):
+    def _build_period_counters(self, user_data, xp_gained, score):
         """
-        Update user stats after challenge completion
+        Add a quiz result to the user's period counters, restarting any
+        counter whose period has rolled over since the last quiz
         """
-        try:
-            user_doc = self.users_ref.document(user_id).get()
-            if not user_doc.exists:
-                raise ValueError("User not found")
-            
-            user_data = user_doc.to_dict()
-            
-            # Calculate rewards
-            xp_gained = challenge_result.get('xp_reward', 0)
-            points_gained = challenge_result.get('points_reward', 0)
-            
-            new_xp = user_data.get('xp', 0) + xp_gained
-            new_level = self._calculate_level_from_xp(new_xp)
-            old_level = user_data.get('level', 1)
-            
-            # Update stats
-            update_data = {
-                'xp': new_xp,
-                'level': new_level,
-                'points': user_data.get('points', 0) + points_gained,
-                'total_challenges_completed': user_data.get('total_challenges_completed', 0) + 1,
-                'last_active_date': datetime.utcnow(),
-                'updated_at': datetime.utcnow()
-            }
-            
-            # Handle level up
-            if new_level > old_level:
-                level_up_rewards = self._handle_level_up(user_id, old_level, new_level)
-                update_data['level_up_rewards'] = level_up_rewards
-            
-            # Update in Firestore
-            self.users_ref.document(user_id).update(update_data)
-            
-            # Update leaderboard
-            self._update_user_leaderboard_position(user_id, new_xp, new_level)
-            
-            logger.info(f"Updated user stats after challenge: {user_id}, XP: {new_xp}")
-            
-            return {
-                'xp_gained': xp_gained,
-                'points_gained': points_gained,
-                'new_xp': new_xp,
-                'new_level': new_level,
-                'level_up': new_level > old_level
-            }
-            
-        except Exception as e:
-            logger.error(f"Error updating user stats after challenge: {str(e)}")
-            raise ValueError(f"Failed to update user stats: {str(e)}")
+        today_key = get_period_key('daily')
+        first_quiz_today = user_data.get('last_quiz_day') != today_key
+        counters = {'last_quiz_day': today_key}
+        
+        for period in COUNTER_PERIODS:
+            period_key = get_period_key(period)
+            same_period = user_data.get(f'{period}_period') == period_key
+            
+            counters[f'{period}_period'] = period_key
+            counters[f'{period}_xp'] = (user_data.get(f'{period}_xp', 0) if same_period else 0) + xp_gained
+            counters[f'{period}_attempts'] = (user_data.get(f'{period}_attempts', 0) if same_period else 0) + 1
+            counters[f'{period}_score_total'] = (user_data.get(f'{period}_score_total', 0) if same_period else 0) + score
+            counters[f'{period}_active_days'] = (
+                (user_data.get(f'{period}_active_days', 0) if same_period else 0)
+                + (1 if first_quiz_today or not same_period else 0)
+            )
+        
+        return counters
+    
+    def build_challenge_stats_update(self, user_id, user_data, challenge_result):
+        """
+        Build the user document update for a completed challenge without writing it
+        """
+        # Calculate rewards
+        xp_gained = challenge_result.get('xp_reward', 0)
+        points_gained = challenge_result.get('points_reward', 0)
+        
+        new_xp = user_data.get('xp', 0) + xp_gained
+        new_level = self._calculate_level_from_xp(new_xp)
+        old_level = user_data.get('level', 1)
+        
+        # Update stats
+        update_data = {
+            'xp': new_xp,
+            'level': new_level,
+            'points': user_data.get('points', 0) + points_gained,
+            'total_challenges_completed': user_data.get('total_challenges_completed', 0) + 1,
+            'last_active_date': datetime.utcnow(),
+            'updated_at': datetime.utcnow()
+        }
+        
+        # Handle level up
+        if new_level > old_level:
+            level_up_rewards = self._handle_level_up(user_id, old_level, new_level)
+            update_data['level_up_rewards'] = level_up_rewards
+        
+        logger.info(f"Updated user stats after challenge: {user_id}, XP: {new_xp}")
+        
+        return update_data, {
+            'xp_gained': xp_gained,
+            'points_gained': points_gained,
+            'new_xp': new_xp,
+            'new_level': new_level,
+            'level_up': new_level > old_level
+        }
     
     def get_class_progress(self, class_id):
         """
@@ -353,109 +357,40 @@ class UserService:
         streak_data = self._update_daily_streak(user_data)
         if streak_data:
             self.users_ref.document(user_id).update(streak_data)
+            user_cache.pop(user_id)
     
-    def _get_recent_activity_stats(self, user_id):
+    def _get_recent_activity_stats(self, user_data):
         """
-        Get user's recent activity statistics
+        Get user's activity statistics for the current week from the
+        counters maintained on quiz submission
         """
-        try:
-            # Get recent quiz attempts (last 7 days)
-            week_ago = datetime.utcnow() - timedelta(days=7)
-            recent_attempts = self.attempts_ref.where('user_id', '==', user_id).where('created_at', '>=', week_ago).stream()
-            
-            recent_stats = {
-                'quizzes_this_week': 0,
-                'average_score_this_week': 0,
-                'xp_earned_this_week': 0,
-                'days_active_this_week': set()
-            }
-            
-            total_score = 0
-            total_xp = 0
-            
-            for attempt in recent_attempts:
-                attempt_data = attempt.to_dict()
-                recent_stats['quizzes_this_week'] += 1
-                total_score += attempt_data.get('score', 0)
-                total_xp += attempt_data.get('earned_xp', 0)
-                
-                # Track active days
-                attempt_date = attempt_data.get('created_at', datetime.utcnow()).date()
-                recent_stats['days_active_this_week'].add(attempt_date)
-            
-            if recent_stats['quizzes_this_week'] > 0:
-                recent_stats['average_score_this_week'] = total_score / recent_stats['quizzes_this_week']
-            
-            recent_stats['xp_earned_this_week'] = total_xp
-            recent_stats['days_active_this_week'] = len(recent_stats['days_active_this_week'])
-            
-            return recent_stats
-            
-        except Exception as e:
-            logger.error(f"Error getting recent activity stats: {str(e)}")
+        if user_data.get('weekly_period') != get_period_key('weekly'):
+            # No quiz yet this week; the stored counters belong to an earlier one
             return {
                 'quizzes_this_week': 0,
                 'average_score_this_week': 0,
                 'xp_earned_this_week': 0,
                 'days_active_this_week': 0
             }
+        
+        quizzes_this_week = user_data.get('weekly_attempts', 0)
+        
+        return {
+            'quizzes_this_week': quizzes_this_week,
+            'average_score_this_week': user_data.get('weekly_score_total', 0) / quizzes_this_week if quizzes_this_week > 0 else 0,
+            'xp_earned_this_week': user_data.get('weekly_xp', 0),
+            'days_active_this_week': user_data.get('weekly_active_days', 0)
+        }
     
-    def _update_user_leaderboard_position(self, user_id, xp, level):
+    def update_user_leaderboard_position(self, user_id, xp, level):
         """
         Update user's position in leaderboards
         """
         try:
-            # Update global leaderboard
-            leaderboard_ref = self.db.collection('leaderboards').document('global')
-            
-            # This is a simplified approach - in production, consider using more efficient methods
-            leaderboard_doc = leaderboard_ref.get()
-            
-            if leaderboard_doc.exists:
-                leaderboard_data = leaderboard_doc.to_dict()
-                entries = leaderboard_data.get('entries', [])
-                
-                # Find and update user entry
-                user_found = False
-                for entry in entries:
-                    if entry.get('user_id') == user_id:
-                        entry['xp'] = xp
-                        entry['level'] = level
-                        entry['updated_at'] = datetime.utcnow()
-                        user_found = True
-                        break
-                
-                # Add user if not found
-                if not user_found:
-                    entries.append({
-                        'user_id': user_id,
-                        'xp': xp,
-                        'level': level,
-                        'updated_at': datetime.utcnow()
-                    })
-                
-                # Sort by XP and keep top 1000
-                entries.sort(key=lambda x: x['xp'], reverse=True)
-                entries = entries[:1000]
-                
-                # Update leaderboard
-                leaderboard_ref.update({
-                    'entries': entries,
-                    'updated_at': datetime.utcnow()
-                })
-            else:
-                # Create new leaderboard
-                leaderboard_ref.set({
-                    'scope': 'global',
-                    'entries': [{
-                        'user_id': user_id,
-                        'xp': xp,
-                        'level': level,
-                        'updated_at': datetime.utcnow()
-                    }],
-                    'created_at': datetime.utcnow(),
-                    'updated_at': datetime.utcnow()
-                })
+            # The user document already holds the new XP, which the ranking queries and
+            # the scheduled rebuild read; only the live ranking needs pushing
+            if self.leaderboard_service is not None:
+                self.leaderboard_service.update_user_leaderboard_position(user_id, xp, level)
                 
         except Exception as e:
             logger.error(f"Error updating user leaderboard position: {str(e)}")
\ No newline at end of file
@@ -4,15 +4,23 @@ setup(
     name="ecolearn",
     version="1.0.0",
     packages=find_packages(),
+    python_requires='>=3.9',
     install_requires=[
         'firebase-admin>=6.2.0',
         'firebase-functions>=0.1.0',
-        'google-cloud-firestore>=2.11.1',
+        'google-cloud-firestore>=2.15.0',
         'google-cloud-storage>=2.10.0',
         'Flask>=2.3.2',
         'Flask-CORS>=4.0.0',
+        'Flask-Compress>=1.14',
+        'Flask-Limiter>=3.5.0',
+        'orjson>=3.9.0',
         'python-dateutil>=2.8.2',
         'pytz>=2023.3',
         'requests>=2.31.0',
     ],
+    extras_require={
+        # Shared leaderboard cache, enabled with REDIS_URL
+        'redis': ['redis>=5.0.0'],
+    },
 )
@@ -19,6 +19,21 @@ def mock_firestore():
         mock_client.return_value = mock_db
         yield mock_db
 
+@pytest.fixture
+def collections(mock_firestore):
+    """Give each Firestore collection its own mock, keyed by collection name"""
+    refs = {}
+    mock_firestore.collection.side_effect = lambda name: refs.setdefault(name, Mock(name=name))
+    return refs
+
+@pytest.fixture
+def mock_transaction(mock_firestore):
+    """Run @firestore.transactional functions directly against a mock transaction"""
+    transaction = Mock()
+    mock_firestore.transaction.return_value = transaction
+    with patch('firebase_admin.firestore.transactional', side_effect=lambda fn: lambda txn: fn(txn)):
+        yield transaction
+
 @pytest.fixture
 def mock_auth():
     """Mock Firebase Auth"""
@@ -132,7 +147,9 @@ class TestQuizService:
             'points_per_question': 10
         }
         
-        mock_firestore.collection().where().stream.return_value = [mock_quiz_doc]
+        # Quiz stored before questions_public existed: the catalog reads the full document
+        mock_quiz_doc.reference.get.return_value.to_dict.return_value = mock_quiz_doc.to_dict.return_value
+        mock_firestore.collection().where().order_by().select().stream.return_value = [mock_quiz_doc]
         
         quiz_service = QuizService(mock_firestore)
         result = quiz_service.get_all_quizzes()
@@ -142,8 +159,10 @@ class TestQuizService:
         assert result[0]['title'] == 'Test Quiz'
         assert 'correct' not in result[0]['questions'][0]  # Should be sanitized
     
-    def test_submit_quiz(self, mock_firestore):
-        """Test quiz submission and grading"""
+    def test_submit_quiz_and_update_stats(self, mock_firestore, collections, mock_transaction, sample_user_data):
+        """Test quiz grading and the transactional attempt + user stats write"""
+        from services.user_service import UserService
+        
         # Mock quiz document
         mock_quiz_doc = Mock()
         mock_quiz_doc.exists = True
@@ -160,20 +179,114 @@ class TestQuizService:
             'points_per_question': 10
         }
         
-        mock_firestore.collection().document().get.return_value = mock_quiz_doc
+        # Mock user document
+        mock_user_doc = Mock()
+        mock_user_doc.exists = True
+        mock_user_doc.to_dict.return_value = sample_user_data
         
         quiz_service = QuizService(mock_firestore)
+        user_service = UserService(mock_firestore)
+        
+        quiz_ref = collections['quizzes'].document.return_value
+        quiz_ref.get.return_value = mock_quiz_doc
+        user_ref = collections['users'].document.return_value
+        user_ref.get.return_value = mock_user_doc
+        attempt_ref = collections['attempts'].document.return_value
         
-        result = quiz_service.submit_quiz(
+        result = quiz_service.submit_quiz_and_update_stats(
             user_id='test-user',
             quiz_id='quiz-1',
-            answers={'q1': 0}  # Correct answer
+            answers={'q1': 0},  # Correct answer
+            user_service=user_service
         )
         
         assert result['score'] == 1
         assert result['score_percentage'] == 100.0
         assert result['earned_xp'] > 0
         assert result['question_results'][0]['is_correct'] is True
+        
+        # Read set: only the user document is read in the transaction, the quiz is read outside it
+        user_ref.get.assert_called_once_with(transaction=mock_transaction)
+        quiz_ref.get.assert_called_once_with()
+        
+        # Writes: the attempt, the quiz statistics and the user stats
+        mock_transaction.set.assert_called_once()
+        assert mock_transaction.set.call_args[0][0] is attempt_ref
+        assert mock_transaction.set.call_args[0][1]['user_id'] == 'test-user'
+        
+        updates = {id(ref): data for (ref, data), _ in mock_transaction.update.call_args_list}
+        assert id(quiz_ref) in updates
+        user_update = updates[id(user_ref)]
+        assert user_update['xp'] == sample_user_data['xp'] + result['earned_xp']
+        assert user_update['points'] == sample_user_data['points'] + result['score']
+        assert user_update['total_quizzes_completed'] == sample_user_data['total_quizzes_completed'] + 1
+        assert user_update['weekly_xp'] == result['earned_xp']
+        
+        # Nothing is written outside the transaction
+        user_ref.update.assert_not_called()
+        attempt_ref.set.assert_not_called()
+    
+    def test_get_user_quiz_attempts_cursor_round_trip(self, mock_firestore):
+        """Test paging attempts with next_cursor, including attempts that share a timestamp"""
+        from datetime import datetime
+        
+        newest = datetime(2024, 3, 3, 12, 0)
+        tied = datetime(2024, 3, 2, 12, 0)
+        oldest = datetime(2024, 3, 1, 12, 0)
+        attempt_times = {'a5': newest, 'a4': tied, 'a3': tied, 'a2': tied, 'a1': oldest}
+        
+        quiz_service = QuizService(mock_firestore)
+        quiz_service.attempts_ref = FakeAttemptsQuery([
+            Mock(id=attempt_id, **{'to_dict.return_value': {'quiz_id': 'quiz-1', 'created_at': created_at}})
+            for attempt_id, created_at in attempt_times.items()
+        ])
+        
+        seen = []
+        cursors = []
+        cursor = None
+        while True:
+            page = quiz_service.get_user_quiz_attempts('test-user', limit=2, start_after=cursor)
+            seen.extend(attempt['id'] for attempt in page['attempts'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+            cursors.append(cursor)
+        
+        # Every attempt exactly once, newest first, with ties broken by id
+        assert seen == ['a5', 'a4', 'a3', 'a2', 'a1']
+        # The page boundary inside the tie carries the attempt id
+        assert cursors[0] == f"{tied.isoformat()}~a4"
+        
+        # Timestamp-only cursors from older clients still parse
+        assert quiz_service._parse_attempts_cursor(tied.isoformat()) == {'created_at': tied}
+
+class FakeAttemptsQuery:
+    """In-memory attempts query ordered by created_at then document id, both descending"""
+    
+    def __init__(self, docs, cursor=None, count=None):
+        self.docs = docs
+        self.cursor = cursor
+        self.count = count
+    
+    def where(self, field, operator, value):
+        return FakeAttemptsQuery(self.docs, self.cursor, self.count)
+    
+    def order_by(self, field, direction='ASCENDING'):
+        return self
+    
+    def start_after(self, values):
+        return FakeAttemptsQuery(self.docs, values, self.count)
+    
+    def limit(self, count):
+        return FakeAttemptsQuery(self.docs, self.cursor, count)
+    
+    def stream(self):
+        sort_key = lambda doc: (doc.to_dict()['created_at'], doc.id)
+        docs = sorted(self.docs, key=sort_key, reverse=True)
+        if self.cursor:
+            boundary = (self.cursor['created_at'], self.cursor.get('__name__', ''))
+            docs = [doc for doc in docs if sort_key(doc) < boundary]
+        return iter(docs[:self.count] if self.count else docs)
 
 # =============================================
 # tests/test_user_service.py
@@ -201,13 +314,8 @@ class TestUserService:
         assert user_service._calculate_xp_for_level(3) == 400
         assert user_service._calculate_xp_for_level(4) == 900
     
-    def test_update_user_stats_after_quiz(self, mock_firestore, sample_user_data):
-        """Test user stats update after quiz completion"""
-        mock_doc = Mock()
-        mock_doc.exists = True
-        mock_doc.to_dict.return_value = sample_user_data
-        mock_firestore.collection().document().get.return_value = mock_doc
-        
+    def test_build_quiz_stats_update(self, mock_firestore, sample_user_data):
+        """Test the user stats update built after quiz completion"""
         user_service = UserService(mock_firestore)
         
         quiz_result = {
@@ -215,11 +323,30 @@ class TestUserService:
             'score': 5
         }
         
-        result = user_service.update_user_stats_after_quiz('test-user', quiz_result)
+        update_data, result = user_service.build_quiz_stats_update('test-user', sample_user_data, quiz_result)
         
         assert result['xp_gained'] == 50
         assert result['new_xp'] == 150  # 100 + 50
         assert result['new_level'] >= 2
+        assert update_data['xp'] == 150
+        assert update_data['points'] == 55
+        assert update_data['total_quizzes_completed'] == 6
+        
+        # Building the update does not write it
+        mock_firestore.collection().document().update.assert_not_called()
+    
+    def test_build_challenge_stats_update(self, mock_firestore, sample_user_data):
+        """Test the user stats update built after challenge completion"""
+        user_service = UserService(mock_firestore)
+        
+        update_data, result = user_service.build_challenge_stats_update(
+            'test-user', sample_user_data, {'xp_reward': 60, 'points_reward': 30}
+        )
+        
+        assert result['new_xp'] == 160
+        assert update_data['xp'] == 160
+        assert update_data['points'] == 80
+        assert update_data['total_challenges_completed'] == 3
 
 # =============================================
 # tests/test_badge_service.py
@@ -267,6 +394,47 @@ class TestBadgeService:
         user_data = {'total_quizzes_completed': 3}
         result = badge_service._check_badge_criteria('test-user', badge, user_data)
         assert result is False
+    
+    def test_award_badges_to_user_batch(self, mock_firestore, collections):
+        """Test that awards go out as one batch: an audit record per badge plus one user update"""
+        from firebase_admin import firestore
+        
+        batch = mock_firestore.batch.return_value
+        badge_service = BadgeService(mock_firestore)
+        
+        awarded = badge_service._award_badges_to_user('test-user', ['eco-starter', 'quiz-master'])
+        
+        assert awarded == ['eco-starter', 'quiz-master']
+        batch.commit.assert_called_once()
+        
+        # Audit records use one id per (user, badge), so a repeated award overwrites it
+        assert [c.args[0] for c in collections['user_badges'].document.call_args_list] == [
+            'test-user_eco-starter', 'test-user_quiz-master'
+        ]
+        assert batch.set.call_count == 2
+        for (_, record), _ in batch.set.call_args_list:
+            assert record['user_id'] == 'test-user'
+            assert record['earned_at'] is firestore.SERVER_TIMESTAMP
+        
+        # One blind user update: ArrayUnion plus an earned_at per badge
+        batch.update.assert_called_once()
+        user_ref, user_update = batch.update.call_args[0]
+        collections['users'].document.assert_called_with('test-user')
+        assert user_ref is collections['users'].document.return_value
+        assert isinstance(user_update['badges'], firestore.ArrayUnion)
+        assert list(user_update['badges'].values) == ['eco-starter', 'quiz-master']
+        assert user_update['badge_earned_at.eco-starter'] is firestore.SERVER_TIMESTAMP
+        assert user_update['badge_earned_at.quiz-master'] is firestore.SERVER_TIMESTAMP
+        
+        # Nothing is read before the write
+        collections['users'].document.return_value.get.assert_not_called()
+    
+    def test_award_badges_to_user_commit_failure(self, mock_firestore):
+        """Test that a failed batch reports no badges awarded"""
+        mock_firestore.batch.return_value.commit.side_effect = Exception("commit failed")
+        badge_service = BadgeService(mock_firestore)
+        
+        assert badge_service._award_badges_to_user('test-user', ['eco-starter']) == []
 
 # =============================================
 # tests/test_challenge_service.py
@@ -285,8 +453,10 @@ class TestChallengeService:
         assert challenge_service._get_difficulty_multiplier('hard') == 1.5
         assert challenge_service._get_difficulty_multiplier('expert') == 2.0
     
-    def test_complete_challenge(self, mock_firestore):
-        """Test challenge completion"""
+    def test_complete_challenge_and_update_stats(self, mock_firestore, collections, mock_transaction, sample_user_data):
+        """Test challenge completion and the transactional completion + user stats write"""
+        from services.user_service import UserService
+        
         # Mock challenge document
         mock_challenge_doc = Mock()
         mock_challenge_doc.exists = True
@@ -298,20 +468,276 @@ class TestChallengeService:
             'type': 'one-time'
         }
         
-        mock_firestore.collection().document().get.return_value = mock_challenge_doc
-        mock_firestore.collection().where().where().limit().stream.return_value = []
+        # Mock user document
+        mock_user_doc = Mock()
+        mock_user_doc.exists = True
+        mock_user_doc.to_dict.return_value = sample_user_data
         
         challenge_service = ChallengeService(mock_firestore)
+        user_service = UserService(mock_firestore)
         
-        result = challenge_service.complete_challenge(
-            user_id='test-user',
-            challenge_id='challenge-1',
-            proof='Completed the challenge'
-        )
+        challenge_ref = collections['challenges'].document.return_value
+        challenge_ref.get.return_value = mock_challenge_doc
+        user_ref = collections['users'].document.return_value
+        user_ref.get.return_value = mock_user_doc
+        completion_ref = collections['user_challenges'].document.return_value
+        existing_query = collections['user_challenges'].where().where().limit()
+        existing_query.stream.return_value = iter([])
+        
+        with patch.object(ChallengeService, '_check_challenge_achievements'), \
+                patch.object(ChallengeService, '_get_suggested_challenges', return_value=[]):
+            result = challenge_service.complete_challenge_and_update_stats(
+                user_id='test-user',
+                challenge_id='challenge-1',
+                proof='Completed the challenge',
+                user_service=user_service
+            )
         
         assert result['challenge_id'] == 'challenge-1'
         assert result['xp_reward'] == 60  # 50 * 1.2 multiplier
         assert result['points_reward'] == 30  # 25 * 1.2 multiplier
+        
+        # Read set: challenge, user and the existing-completion check, all in the transaction
+        challenge_ref.get.assert_called_once_with(transaction=mock_transaction)
+        user_ref.get.assert_called_once_with(transaction=mock_transaction)
+        existing_query.stream.assert_called_once_with(transaction=mock_transaction)
+        
+        # Writes: the completion record, the challenge statistics and the user stats
+        mock_transaction.set.assert_called_once()
+        assert mock_transaction.set.call_args[0][0] is completion_ref
+        assert mock_transaction.set.call_args[0][1]['xp_reward'] == 60
+        
+        updates = {id(ref): data for (ref, data), _ in mock_transaction.update.call_args_list}
+        assert 'total_completions' in updates[id(challenge_ref)]
+        user_update = updates[id(user_ref)]
+        assert user_update['xp'] == sample_user_data['xp'] + 60
+        assert user_update['points'] == sample_user_data['points'] + 30
+        assert user_update['total_challenges_completed'] == sample_user_data['total_challenges_completed'] + 1
+    
+    def test_complete_challenge_already_completed(self, mock_firestore, collections, mock_transaction, sample_user_data):
+        """Test a one-time challenge cannot be completed twice"""
+        from services.user_service import UserService
+        
+        mock_challenge_doc = Mock()
+        mock_challenge_doc.exists = True
+        mock_challenge_doc.to_dict.return_value = {'xp_reward': 50, 'type': 'one-time'}
+        mock_user_doc = Mock()
+        mock_user_doc.exists = True
+        mock_user_doc.to_dict.return_value = sample_user_data
+        
+        challenge_service = ChallengeService(mock_firestore)
+        
+        collections['challenges'].document.return_value.get.return_value = mock_challenge_doc
+        collections['users'].document.return_value.get.return_value = mock_user_doc
+        collections['user_challenges'].where().where().limit().stream.return_value = iter([Mock()])
+        
+        with pytest.raises(ValueError, match='already completed'):
+            challenge_service.complete_challenge_and_update_stats(
+                'test-user', 'challenge-1', '', UserService(mock_firestore)
+            )
+        
+        mock_transaction.set.assert_not_called()
+        mock_transaction.update.assert_not_called()
+
+# =============================================
+# tests/test_cache.py
+import pytest
+from unittest.mock import Mock, patch
+from utils.cache import TTLCache, user_cache
+from utils.auth_middleware import TOKEN_CACHE_MAX_TTL, _token_cache, verify_id_token
+
+class TestTTLCache:
+    
+    def test_entries_expire_after_ttl(self):
+        """Test that entries expire after the default or per-entry TTL"""
+        with patch('utils.cache.time') as mock_time:
+            mock_time.monotonic.return_value = 0.0
+            cache = TTLCache(maxsize=10, ttl=60)
+            cache.set('default', 1)
+            cache.set('short', 2, ttl=10)
+            
+            mock_time.monotonic.return_value = 30.0
+            assert cache.get('default') == 1
+            assert cache.get('short') is None
+            
+            mock_time.monotonic.return_value = 60.0
+            assert cache.get('default') is None
+            assert len(cache) == 0
+    
+    def test_evicts_oldest_entry_when_full(self):
+        """Test that a full cache drops its oldest entry"""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+        
+        assert 'a' not in cache
+        assert cache.get('b') == 2
+        assert cache.get('c') == 3
+    
+    def test_user_writes_invalidate_cached_user(self, mock_firestore, collections, sample_user_data):
+        """Test that user documents are served from the shared cache until a write pops them"""
+        from services.auth_service import AuthService
+        from services.user_service import UserService
+        
+        user_cache.clear()
+        auth_service = AuthService(mock_firestore)
+        user_ref = collections['users'].document.return_value
+        user_ref.get.return_value = Mock(exists=True, **{'to_dict.return_value': sample_user_data})
+        
+        assert auth_service.get_user_by_uid('test-user-id')['xp'] == 100
+        # Callers get a copy, so mutating it leaves the cache intact
+        auth_service.get_user_by_uid('test-user-id')['xp'] = 0
+        assert auth_service.get_user_by_uid('test-user-id')['xp'] == 100
+        user_ref.get.assert_called_once()
+        
+        UserService(mock_firestore).update_user_profile('test-user-id', {'name': 'Renamed'})
+        assert 'test-user-id' not in user_cache
+        
+        auth_service.get_user_by_uid('test-user-id')
+        assert user_ref.get.call_count == 2
+        user_cache.clear()
+
+class TestTokenCache:
+    
+    def verify_at(self, wall_time, monotonic_time, token='token'):
+        with patch('utils.auth_middleware.time') as mock_wall, patch('utils.cache.time') as mock_clock:
+            mock_wall.time.return_value = wall_time
+            mock_clock.monotonic.return_value = monotonic_time
+            return verify_id_token(token)
+    
+    def test_token_cache_ttl_capped_by_exp(self):
+        """Test that a cached token is re-verified once the JWT expires"""
+        _token_cache.clear()
+        with patch('utils.auth_middleware.auth') as mock_auth:
+            mock_auth.verify_id_token.return_value = {'uid': 'test-user', 'exp': 1120}
+            
+            self.verify_at(1000.0, 0.0)
+            self.verify_at(1119.0, 119.0)
+            assert mock_auth.verify_id_token.call_count == 1
+            
+            self.verify_at(1121.0, 121.0)
+            assert mock_auth.verify_id_token.call_count == 2
+        _token_cache.clear()
+    
+    def test_token_cache_ttl_capped_by_max_ttl(self):
+        """Test that long-lived tokens are still re-verified after TOKEN_CACHE_MAX_TTL"""
+        _token_cache.clear()
+        with patch('utils.auth_middleware.auth') as mock_auth:
+            mock_auth.verify_id_token.return_value = {'uid': 'test-user', 'exp': 1000 + 2 * TOKEN_CACHE_MAX_TTL}
+            
+            self.verify_at(1000.0, 0.0)
+            self.verify_at(1000.0 + TOKEN_CACHE_MAX_TTL - 1, TOKEN_CACHE_MAX_TTL - 1)
+            assert mock_auth.verify_id_token.call_count == 1
+            
+            self.verify_at(1000.0 + TOKEN_CACHE_MAX_TTL, TOKEN_CACHE_MAX_TTL)
+            assert mock_auth.verify_id_token.call_count == 2
+        _token_cache.clear()
+    
+    def test_expired_token_not_cached(self):
+        """Test that a token already past exp is never cached"""
+        _token_cache.clear()
+        with patch('utils.auth_middleware.auth') as mock_auth:
+            mock_auth.verify_id_token.return_value = {'uid': 'test-user', 'exp': 900}
+            
+            self.verify_at(1000.0, 0.0)
+            self.verify_at(1000.0, 0.0)
+            assert mock_auth.verify_id_token.call_count == 2
+            assert len(_token_cache) == 0
+
+# =============================================
+# tests/test_leaderboard_service.py
+import pytest
+from unittest.mock import Mock, patch
+from datetime import datetime, timedelta
+from services.leaderboard_service import LEADERBOARD_PROFILE_FIELDS, LeaderboardService, get_period_key
+
+class TestLeaderboardService:
+    
+    def stored_board(self, collections, now, **overrides):
+        """Store a fresh materialized all-time board with three entries and a deeper rank map"""
+        entries = [
+            {'rank': rank, 'user_id': f'user-{rank}', 'name': f'User {rank}', 'xp': 1000 - rank}
+            for rank in (1, 2, 3)
+        ]
+        board_doc = Mock(exists=True)
+        board_doc.to_dict.return_value = {
+            'scope': 'global',
+            'period': 'all',
+            'period_key': get_period_key('all', now),
+            'entries': entries,
+            'user_rank_map': {'user-1': 1, 'user-2': 2, 'user-3': 3, 'user-150': 150},
+            'truncated': True,
+            'updated_at': now - timedelta(minutes=5),
+            **overrides
+        }
+        collections['leaderboards'].document.return_value.get.return_value = board_doc
+        return entries
+    
+    def test_materialized_board_response_shape(self, mock_firestore, collections):
+        """Test the response built from a stored board for a user among its entries"""
+        now = datetime.utcnow()
+        leaderboard_service = LeaderboardService(mock_firestore)
+        entries = self.stored_board(collections, now)
+        
+        board = leaderboard_service._get_materialized_leaderboard('global', 'all', 2, 'user-2', now)
+        
+        assert board == {
+            'scope': 'global',
+            'period': 'all',
+            'entries': entries[:2],
+            'current_user': {'rank': 2, 'data': entries[1]},
+            'total_entries': 2,
+            'updated_at': now - timedelta(minutes=5)
+        }
+        collections['leaderboards'].document.assert_called_with('global_all')
+        collections['users'].document.assert_not_called()
+    
+    def test_materialized_board_keeps_mapped_rank_below_entries(self, mock_firestore, collections):
+        """Test that a user ranked below the stored entries keeps the mapped rank"""
+        now = datetime.utcnow()
+        leaderboard_service = LeaderboardService(mock_firestore)
+        self.stored_board(collections, now)
+        user_ref = collections['users'].document.return_value
+        user_ref.get.return_value = Mock(exists=True, **{'to_dict.return_value': {'name': 'Deep', 'xp': 40, 'level': 1}})
+        
+        with patch.object(leaderboard_service, '_find_live_user_rank') as live_rank:
+            board = leaderboard_service._get_materialized_leaderboard('global', 'all', 3, 'user-150', now)
+        
+        live_rank.assert_not_called()
+        user_ref.get.assert_called_once_with(field_paths=LEADERBOARD_PROFILE_FIELDS)
+        assert board['current_user']['rank'] == 150
+        assert board['current_user']['data']['rank'] == 150
+        assert board['current_user']['data']['user_id'] == 'user-150'
+        assert board['current_user']['data']['xp'] == 40
+    
+    def test_materialized_board_ranks_unmapped_user_live(self, mock_firestore, collections):
+        """Test that a user missing from the rank map is ranked against current data"""
+        now = datetime.utcnow()
+        leaderboard_service = LeaderboardService(mock_firestore)
+        self.stored_board(collections, now)
+        live_entry = {'rank': 4000, 'user_id': 'new-user'}
+        
+        with patch.object(leaderboard_service, '_find_live_user_rank', return_value=(4000, live_entry)) as live_rank:
+            board = leaderboard_service._get_materialized_leaderboard('global', 'all', 3, 'new-user', now)
+        
+        live_rank.assert_called_once_with('new-user', 'all', now)
+        assert board['current_user'] == {'rank': 4000, 'data': live_entry}
+    
+    def test_materialized_board_unusable(self, mock_firestore, collections):
+        """Test that stale, rolled-over or too-short boards fall back to live computation"""
+        now = datetime.utcnow()
+        leaderboard_service = LeaderboardService(mock_firestore)
+        
+        self.stored_board(collections, now, updated_at=now - timedelta(hours=1))
+        assert leaderboard_service._get_materialized_leaderboard('global', 'all', 3, None, now) is None
+        
+        self.stored_board(collections, now, period_key='1999-01-01')
+        assert leaderboard_service._get_materialized_leaderboard('global', 'all', 3, None, now) is None
+        
+        # More entries requested than were stored from a truncated ranking
+        self.stored_board(collections, now)
+        assert leaderboard_service._get_materialized_leaderboard('global', 'all', 10, None, now) is None
 
 # =============================================
 # tests/test_api_endpoints.py
@@ -404,31 +830,32 @@ class TestIntegration:
         }
         
         mock_db = Mock()
-        mock_db.collection().document().get.return_value = mock_quiz_doc
+        collections = {}
+        mock_db.collection.side_effect = lambda name: collections.setdefault(name, Mock(name=name))
         mock_firestore.return_value = mock_db
         
         # Test workflow
         quiz_service = QuizService(mock_db)
         user_service = UserService(mock_db)
         
-        # 1. Submit quiz
-        quiz_result = quiz_service.submit_quiz(
-            user_id='test-user',
-            quiz_id='test-quiz',
-            answers={'q1': 0}
-        )
+        collections['quizzes'].document.return_value.get.return_value = mock_quiz_doc
+        collections['users'].document.return_value.get.return_value = mock_user_doc
+        transaction = mock_db.transaction.return_value
+        
+        # Submit quiz; the attempt and the user stats are written in one transaction
+        with patch('firebase_admin.firestore.transactional', side_effect=lambda fn: lambda txn: fn(txn)):
+            quiz_result = quiz_service.submit_quiz_and_update_stats(
+                user_id='test-user',
+                quiz_id='test-quiz',
+                answers={'q1': 0},
+                user_service=user_service
+            )
         
         assert quiz_result['score_percentage'] == 100.0
         
-        # 2. Update user stats
-        mock_db.collection().document().get.return_value = mock_user_doc
-        
-        user_update = user_service.update_user_stats_after_quiz(
-            'test-user',
-            quiz_result
-        )
-        
-        assert user_update['xp_gained'] > 0
+        user_ref = collections['users'].document.return_value
+        user_update = next(data for (ref, data), _ in transaction.update.call_args_list if ref is user_ref)
+        assert user_update['xp'] > 100
 
 # =============================================
 # Additional Test Utilities
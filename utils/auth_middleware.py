@@ -4,49 +4,91 @@ Handles Firebase token validation and request authentication
 """
 
 from functools import wraps
-from flask import request, jsonify
+from flask import g, request, jsonify
 from firebase_admin import auth
+import hashlib
 import logging
+import time
+
+from utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Verified ID tokens keyed by SHA-256 of the raw token; entries never outlive the JWT
+TOKEN_CACHE_MAX_TTL = 3600
+_token_cache = TTLCache(maxsize=10000, ttl=TOKEN_CACHE_MAX_TTL)
+
+def verify_id_token(token):
+    """
+    Verify Firebase ID token, reusing a cached result until the token expires
+    """
+    cache_key = hashlib.sha256(token.encode('utf-8')).digest()
+    decoded_token = _token_cache.get(cache_key)
+    if decoded_token is not None:
+        return decoded_token
+    
+    decoded_token = auth.verify_id_token(token)
+    
+    # Bound the cache entry by the token's own expiry
+    remaining = decoded_token.get('exp', 0) - time.time()
+    if remaining > 0:
+        _token_cache.set(cache_key, decoded_token, ttl=min(remaining, TOKEN_CACHE_MAX_TTL))
+    
+    return decoded_token
+
+def get_bearer_token():
+    """
+    Return the token from the request's 'Authorization: Bearer <token>' header
+    """
+    return request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+
+def authenticate_request():
+    """
+    Verify the request's bearer token once and store the claims on g.current_user.
+    Returns an error response, or None when the request is authenticated
+    """
+    try:
+        # Get token from Authorization header
+        auth_header = request.headers.get('Authorization')
+        if not auth_header:
+            return jsonify({'error': 'Authorization header required'}), 401
+        
+        token = get_bearer_token()
+        if not token:
+            return jsonify({'error': 'Valid token required'}), 401
+        
+        # Verify token with Firebase (cached per token)
+        decoded_token = verify_id_token(token)
+        
+        # Add user info to request context so handlers don't re-verify
+        g.current_user = decoded_token
+        
+        return None
+        
+    except auth.ExpiredIdTokenError:
+        logger.warning("Expired token provided")
+        return jsonify({'error': 'Token expired'}), 401
+    except auth.InvalidIdTokenError:
+        logger.warning("Invalid token provided")
+        return jsonify({'error': 'Invalid token'}), 401
+    except auth.RevokedIdTokenError:
+        logger.warning("Revoked token provided")
+        return jsonify({'error': 'Token revoked'}), 401
+    except Exception as e:
+        logger.error(f"Authentication error: {str(e)}")
+        return jsonify({'error': 'Authentication failed'}), 401
+
 def require_auth(f):
     """
     Decorator to require authentication for API endpoints
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        try:
-            # Get token from Authorization header
-            auth_header = request.headers.get('Authorization')
-            if not auth_header:
-                return jsonify({'error': 'Authorization header required'}), 401
-            
-            # Extract token (remove 'Bearer ' prefix)
-            token = auth_header.replace('Bearer ', '').strip()
-            if not token:
-                return jsonify({'error': 'Valid token required'}), 401
-            
-            # Verify token with Firebase
-            decoded_token = auth.verify_id_token(token)
-            
-            # Add user info to request context
-            request.current_user = decoded_token
-            
-            return f(*args, **kwargs)
-            
-        except auth.ExpiredIdTokenError:
-            logger.warning("Expired token provided")
-            return jsonify({'error': 'Token expired'}), 401
-        except auth.InvalidIdTokenError:
-            logger.warning("Invalid token provided")
-            return jsonify({'error': 'Invalid token'}), 401
-        except auth.RevokedIdTokenError:
-            logger.warning("Revoked token provided")
-            return jsonify({'error': 'Token revoked'}), 401
-        except Exception as e:
-            logger.error(f"Authentication error: {str(e)}")
-            return jsonify({'error': 'Authentication failed'}), 401
+        error_response = authenticate_request()
+        if error_response is not None:
+            return error_response
+        
+        return f(*args, **kwargs)
     
     return decorated_function
 
@@ -59,10 +101,10 @@ def get_user_from_token(token):
             return None
         
         # Remove 'Bearer ' prefix if present
-        clean_token = token.replace('Bearer ', '').strip()
+        clean_token = token.removeprefix('Bearer ').strip()
         
         # Verify and decode token
-        decoded_token = auth.verify_id_token(clean_token)
+        decoded_token = verify_id_token(clean_token)
         
         return {
             'uid': decoded_token['uid'],
@@ -89,8 +131,8 @@ def require_admin(f):
             if not auth_header:
                 return jsonify({'error': 'Authorization header required'}), 401
             
-            token = auth_header.replace('Bearer ', '').strip()
-            decoded_token = auth.verify_id_token(token)
+            token = get_bearer_token()
+            decoded_token = verify_id_token(token)
             
             # Check for admin claim
             is_admin = decoded_token.get('admin', False)
@@ -103,7 +145,7 @@ def require_admin(f):
                 logger.warning(f"Non-admin user attempted admin action: {decoded_token['uid']}")
                 return jsonify({'error': 'Admin privileges required'}), 403
             
-            request.current_user = decoded_token
+            g.current_user = decoded_token
             return f(*args, **kwargs)
             
         except Exception as e:
@@ -124,8 +166,8 @@ def require_teacher(f):
             if not auth_header:
                 return jsonify({'error': 'Authorization header required'}), 401
             
-            token = auth_header.replace('Bearer ', '').strip()
-            decoded_token = auth.verify_id_token(token)
+            token = get_bearer_token()
+            decoded_token = verify_id_token(token)
             
             # Check for teacher or admin claim
             is_teacher = decoded_token.get('teacher', False)
@@ -140,7 +182,7 @@ def require_teacher(f):
                 logger.warning(f"Non-teacher user attempted teacher action: {decoded_token['uid']}")
                 return jsonify({'error': 'Teacher privileges required'}), 403
             
-            request.current_user = decoded_token
+            g.current_user = decoded_token
             return f(*args, **kwargs)
             
         except Exception as e:
@@ -159,24 +201,24 @@ def optional_auth(f):
             # Get token from Authorization header
             auth_header = request.headers.get('Authorization')
             if auth_header:
-                token = auth_header.replace('Bearer ', '').strip()
+                token = get_bearer_token()
                 if token:
                     try:
-                        decoded_token = auth.verify_id_token(token)
-                        request.current_user = decoded_token
+                        decoded_token = verify_id_token(token)
+                        g.current_user = decoded_token
                     except:
                         # Invalid token, but continue without auth
-                        request.current_user = None
+                        g.current_user = None
                 else:
-                    request.current_user = None
+                    g.current_user = None
             else:
-                request.current_user = None
+                g.current_user = None
             
             return f(*args, **kwargs)
             
         except Exception as e:
             logger.error(f"Optional auth error: {str(e)}")
-            request.current_user = None
+            g.current_user = None
             return f(*args, **kwargs)
     
     return decorated_function
@@ -0,0 +1,76 @@
+"""
+Batched Writes for EcoLearn Platform
+Helpers for committing many Firestore writes in as few round-trips as possible
+"""
+
+import time
+
+from google.api_core.exceptions import Aborted
+
+from utils.concurrency import get_executor
+
+# Firestore rejects a batch with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+# Smaller batches for parallel commits: spreads load and keeps a retried commit cheap
+PARALLEL_BATCH_WRITES = 50
+MAX_COMMIT_ATTEMPTS = 3
+
+
+def commit_in_batches(db, writes, batch_size=MAX_BATCH_WRITES):
+    """
+    Apply (doc_ref, data) pairs as set() writes in WriteBatch commits of up
+    to batch_size operations; returns the number of documents written
+    """
+    batch = db.batch()
+    pending = 0
+    written = 0
+
+    for doc_ref, data in writes:
+        batch.set(doc_ref, data)
+        pending += 1
+
+        if pending == batch_size:
+            batch.commit()
+            written += pending
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+        written += pending
+
+    return written
+
+
+def commit_in_parallel(db, writes, batch_size=PARALLEL_BATCH_WRITES):
+    """
+    Split (doc_ref, data) set() writes into small WriteBatches and commit them
+    concurrently on the shared I/O pool; returns the number of documents written
+    """
+    writes = list(writes)
+    chunks = [writes[i:i + batch_size] for i in range(0, len(writes), batch_size)]
+
+    if len(chunks) <= 1:
+        return commit_in_batches(db, writes)
+
+    return sum(get_executor().map(lambda chunk: _commit_chunk(db, chunk), chunks))
+
+
+def _commit_chunk(db, chunk):
+    """
+    Commit one minibatch, retrying with backoff when Firestore aborts it
+    on contention (set() writes are idempotent, so a retry is safe)
+    """
+    for attempt in range(1, MAX_COMMIT_ATTEMPTS + 1):
+        batch = db.batch()
+        for doc_ref, data in chunk:
+            batch.set(doc_ref, data)
+
+        try:
+            batch.commit()
+            return len(chunk)
+        except Aborted:
+            if attempt == MAX_COMMIT_ATTEMPTS:
+                raise
+            time.sleep(0.1 * 2 ** attempt)
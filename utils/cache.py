@@ -0,0 +1,85 @@
+"""
+In-Process Cache for EcoLearn Platform
+Thread-safe TTL cache used to avoid repeated Firebase and Firestore round-trips
+"""
+
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Bounded cache whose entries expire after a time-to-live (in seconds)
+    """
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key, or default if missing or expired
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store value under key; ttl overrides the cache default for this entry
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            self._data.pop(key, None)
+
+            if len(self._data) >= self.maxsize:
+                self._evict()
+
+            self._data[key] = (expires_at, value)
+
+    def pop(self, key, default=None):
+        """
+        Remove key from the cache and return its value
+        """
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+
+    def clear(self):
+        """
+        Remove all entries
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._data)
+
+    def _evict(self):
+        """
+        Drop expired entries, then the oldest entry if still full (lock held)
+        """
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self._data.items() if expires_at <= now]:
+            del self._data[key]
+
+        if len(self._data) >= self.maxsize:
+            del self._data[next(iter(self._data))]
+
+
+# Full user documents by uid, shared by every service in this process. Code that
+# writes a user document pops its entry; writes from other instances are bounded by the ttl
+user_cache = TTLCache(maxsize=10000, ttl=60)
@@ -0,0 +1,73 @@
+"""
+Concurrency Helpers for EcoLearn Platform
+Shared thread pool for overlapping independent Firestore round-trips
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import threading
+
+# Firestore and Firebase Auth calls are network-bound, so threads overlap their latency
+MAX_IO_WORKERS = int(os.environ.get('MAX_IO_WORKERS', 16))
+_executor = ThreadPoolExecutor(max_workers=MAX_IO_WORKERS, thread_name_prefix='ecolearn-io')
+
+
+def get_executor():
+    """
+    Return the process-wide executor for background I/O
+    """
+    return _executor
+
+
+def run_parallel(*calls):
+    """
+    Run zero-argument callables concurrently and return their results in order.
+    The first call runs on the calling thread; any exception is re-raised here.
+    Only the first call may itself use run_parallel: pooled calls that wait on
+    the pool can exhaust its workers and deadlock
+    """
+    if len(calls) <= 1:
+        return [call() for call in calls]
+
+    futures = [_executor.submit(call) for call in calls[1:]]
+    first_result = calls[0]()
+
+    return [first_result] + [future.result() for future in futures]
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key: the first caller runs the
+    function, callers arriving while it is in flight wait for and share its
+    result (or exception)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._done(key)
+            future.set_exception(e)
+            raise
+
+        self._done(key)
+        future.set_result(result)
+        return result
+
+    def _done(self, key):
+        # Forget the call before publishing its outcome so later callers start fresh
+        with self._lock:
+            self._in_flight.pop(key, None)
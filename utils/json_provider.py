@@ -0,0 +1,57 @@
+"""
+JSON Provider for EcoLearn Platform
+Serializes Flask responses with orjson while keeping Flask's output format
+"""
+
+from datetime import date
+from decimal import Decimal
+from uuid import UUID
+import dataclasses
+
+from flask.json.provider import JSONProvider
+from werkzeug.http import http_date
+import orjson
+
+
+def _default(o):
+    """
+    Serialize the types Flask's default provider supports but orjson does not
+    handle the same way (dates are kept in HTTP date format for API compatibility)
+    """
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (Decimal, UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    Flask JSON provider backed by orjson; keys keep insertion order
+    """
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self.option).decode('utf-8')
+
+    def dumps_bytes(self, obj):
+        """
+        Serialize obj straight to UTF-8 bytes
+        """
+        return orjson.dumps(obj, default=_default, option=self.option)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping the str round-trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)